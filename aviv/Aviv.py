@@ -30,21 +30,28 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 # -- END OF INTRO -- #
+import collections
 import datetime
 import logging
-import os
-import shelve
-import sys
+import threading
 import time
 import urllib.request
 # Uncomment the following line to use the astral builtin geocoder.
 # Se Astral documentation for alternatives.
 from astral import Astral
+from astral import Location
 # Using GoogleGeocoder requires you to accept their licenses and terms
 # of service.
 from astral import GoogleGeocoder
 from astral import AstralError
-from aviv import hist_data
+from aviv import astro
+from aviv import data
+from aviv import instrument
+from aviv import trace
+from aviv.cache import LRUCache
+from aviv.data import DB_FILE, combine_data, get_latest_data, preload
+from aviv.geocoder import LOCATION_POOL, OfflineGeocoder
+from aviv.month_index import MIN_MONTH_LENGTH
 
 
 def usage():
@@ -54,6 +61,7 @@ def usage():
 
 def debug(d):
     if d is True:
+        trace.enable()
         logging.basicConfig(
             level=logging.DEBUG,
             format=' %(asctime)s - %(levelname)s - %(message)s')
@@ -146,81 +154,19 @@ FIXED_HIGH_FEAST_DAYS = {
 }
 
 
-def get_latest_data():
-    """Fetches the latest data available from avivcalendar.com."""
-    # Download the file from `https://www.avivcalendar.com/latest_data`
-    # and save it locally under `latest_data.py`. This is updated as soon
-    # as news of the new moon or the Aviv barley breaks.
-    url = 'https://www.avivcalendar.com/latest-data'
-    latest_file = os.path.join(sys.path[0], 'latest_data.py')
-    try:
-        with urllib.request.urlopen(url) as response, open(latest_file,
-                                                           'wb') as out_file:
-            data = response.read()
-            out_file.write(data)
-            out_file.close()
-    except urllib.error.URLError:
-        raise Exception(
-            'Unable to connect to {}\nPlease check your internet connection.'.
-            format(url))
-
-
-# Working with a DB_FILE since we will be joining dictionaries from both git
-# synced sources, as well as the latest_data.py that is retrieved from
-# online.
-DB_FILE = os.path.join(sys.path[0], 'current_data')
-DB_ACTUAL_FILE = os.path.join(sys.path[0], 'current_data.DB')
-DB_EXISTS = os.path.exists(DB_ACTUAL_FILE)
-if DB_EXISTS:
-    DB_MOD_TIME = datetime.datetime.fromtimestamp(
-        os.path.getmtime(DB_ACTUAL_FILE))
-
-
-# Combine the data from hist_data (which is distributed with the source code),
-# and data from latest_data, which is synced in get_latest_data above.
-def combine_data():
-    """Combine data from source code with data fetched online and create DB."""
-    get_latest_data()
-    # I didn't want this import to be at the top of the file, since the
-    # latest_data.py file will not exist on first run.
-    # TODO: Is that the correct way to do it?
-    from aviv import latest_data
-    database = shelve.open(DB_FILE)
-
-    # Potentially needed clearing of DB befor each run. Or is that overkill?
-    # TODO: Needs testing.
-    database.clear()
-
-    def merge_two_dicts(dict_x, dict_y):
-        """Merges two dictionaries: historical data and latest data."""
-        dict_z = dict_x.copy()  # start with dict_x's keys and values
-        dict_z.update(
-            dict_y
-        )  # modifies dict_z with dict_y's keys and values & returns None
-        return dict_z
-
-    # Combine hist_data and latest_data and stash it in the database.
-    temp_moons = merge_two_dicts(latest_data.LAST_MOON, hist_data.MOONS)
-    moons = merge_two_dicts(temp_moons, latest_data.NEXT_MOON)
-
-    database['MOONS'] = moons
-    database['AVIV_BARLEY'] = latest_data.AVIV_BARLEY
-    database.close()
-
-
-# Open the database, if none exists run the function to create one.
-if DB_EXISTS is not True:
-    logging.debug('DB_FILE does not exist on this system. Creating a new one.')
-    combine_data()
-
-# Get the database in order.
-DB = shelve.open(DB_FILE)
-MOONS = DB['MOONS']
-AVIV_BARLEY = DB['AVIV_BARLEY']
-DB.close()
-
-
-def datetime_from_key(k):
+def __getattr__(name):
+    """Gives access to the moon data that used to be module globals."""
+    # The data is loaded lazily by `data.MOON_DATA`, so that importing this
+    # module is free from side effects.
+    if name == 'MOONS':
+        return data.MOON_DATA.moons
+    if name == 'AVIV_BARLEY':
+        return data.MOON_DATA.aviv_barley
+    raise AttributeError('module {!r} has no attribute {!r}'.format(
+        __name__, name))
+
+
+def datetime_from_key(k, snapshot=None):
     """Creates a datetime object from key (k).
 
     First tries to find the month in the ´MOONS´.
@@ -230,13 +176,17 @@ def datetime_from_key(k):
     estimated guess. Note that most historical MOONS before 6001 will always
     be estimated.
 
-    Keys need to be in the form of YYYYMM (example: 600101)."""
+    Keys need to be in the form of YYYYMM (example: 600101). snapshot is
+    the `data.DataSnapshot` to look in, by default the current."""
+    if snapshot is None:
+        snapshot = data.MOON_DATA.snapshot()
+    moons = snapshot.moons
     try:
-        if MOONS[k]:
-            year = MOONS[k][2]
-            month = MOONS[k][3]
-            day = MOONS[k][4]
-            is_known = MOONS[k][5]
+        if moons[k]:
+            year = moons[k][2]
+            month = moons[k][3]
+            day = moons[k][4]
+            is_known = moons[k][5]
             date = datetime.date(year, month, day)
             # Returns as a tuple.
             return (date, is_known)
@@ -360,26 +310,28 @@ def test_is_feast(month, day):
     Optional length of previous month as integer.
     Example: 10, 1, 29"""
     pf = (month, day)
-    logging.debug('entering `test_is_feast`, pf is %s', pf)
+    if trace.ENABLED:
+        trace.trace('entering `test_is_feast`, pf is %s', pf)
     try:
         if FIXED_HIGH_FEAST_DAYS[pf]:
-            logging.debug('found a matching high feast day!')
+            if trace.ENABLED:
+                trace.trace('found a matching high feast day!')
             is_hfd = True
             is_hfs = FIXED_HIGH_FEAST_DAYS[pf][1]
             feast_name = FIXED_HIGH_FEAST_DAYS[pf][0]
     except KeyError:
         try:
             if FIXED_FEAST_DAYS[pf]:
-                logging.debug('found a matching feast day!')
+                if trace.ENABLED:
+                    trace.trace('found a matching feast day!')
                 is_hfd = True
                 is_hfs = FIXED_FEAST_DAYS[pf][1]
                 feast_name = FIXED_FEAST_DAYS[pf][0]
         except KeyError:
             is_hfd, is_hfs, feast_name = False, False, None
-    logging.debug('returning the following:')
-    logging.debug('is_hfd: %s', is_hfd)
-    logging.debug('is_hfs: %s', is_hfs)
-    logging.debug('feast_name: %s', feast_name)
+    if trace.ENABLED:
+        trace.trace('returning is_hfd: %s, is_hfs: %s, feast_name: %s',
+                    is_hfd, is_hfs, feast_name)
     return (is_hfd, is_hfs, feast_name)
 
 
@@ -387,44 +339,424 @@ def find_firstfruits(year, month, day):
     """Tries to find out what day is
     the Feast of Firstfruits.
     """
-    # Create a key to pinpoint the first day of the first month of the year.
-    # This is the baseline to find the firstfruits.
-    key = int(str(year) + '01')
-    first_month = datetime_from_key(key)
-    i = 0
-
-    # Iterate over the days following unleavened bread until you find the
-    # 1st day of the week.
-    while i < 7:
-        potential_day = first_month[0] + datetime.timedelta(days=16 + i)
-        x_year = potential_day.year
-        x_month = potential_day.month
-        x_day = potential_day.day
-        potential_day_object = BibLocation('Jerusalem', 'astral', x_year,
-                                           x_month, x_day, 22)
-        logging.debug('weekday is %s', potential_day_object.g_time.weekday())
-        if potential_day_object.g_time.weekday() == 6:
-            firstfruits = (year, 1, 16 + i)
-            logging.debug('"firstfruits" is: %s', firstfruits)
-            break
-        i += 1
-
-    logging.debug('test date is: %s', (year, month, day))
+    firstfruits = year_calendar(year).firstfruits
+    if trace.ENABLED:
+        trace.trace('"firstfruits" is: %s, test date is: %s', firstfruits,
+                    (year, month, day))
     firstfruits_today = True if (year, month, day) == firstfruits else False
     return (firstfruits, firstfruits_today)
 
 
-def last_moon_check():
-    """Imports latest data and sets the last_moon variables."""
-    from aviv import latest_data
-    last_moon = latest_data.LAST_MOON
+class YearCalendar:
+    """The feast days of a biblical year.
+
+    Everything is worked out once from the month index when the object is
+    created. Use `year_calendar` to get a memoized one.
+
+    Feast days are tuples of (year, month, day) in biblical time. The
+    `_date` attributes are the gregorian dates of the daylight part of those
+    days. `feasts` maps (month, day) to (is_hfd, is_hfs, feast_name) for
+    every feast day of the year, with the same precedence as `feast_status`
+    always had. `fixed_feasts` holds every day of FIXED_FEAST_DAYS and
+    FIXED_HIGH_FEAST_DAYS found in the year.
+
+    `feast_days` lists the same days in the order they come, as tuples of
+    (eve, month, day, is_hfd, is_hfs, feast_name), where eve is the ordinal
+    of the gregorian date the day starts on at sunset."""
+
+    def __init__(self, b_year, month_index):
+        self.year = b_year
+        self.month_starts = month_index.months_of_year(b_year)
+        self.firstfruits = None
+        self.firstfruits_date = None
+        self.shavuot = None
+        self.shavuot_date = None
+        # The first and last gregorian date of the omer count.
+        self.omer = None
+        self.hanukkah = ()
+        self.fixed_feasts = {}
+        self.feasts = {}
+        self.feast_days = ()
+
+        for fixed_days in (FIXED_FEAST_DAYS, FIXED_HIGH_FEAST_DAYS):
+            for pf, feast in fixed_days.items():
+                if pf[0] in self.month_starts:
+                    self.fixed_feasts[pf] = (True, feast[1], feast[0])
+
+        self._find_firstfruits()
+        self._find_hanukkah()
+        self._fill_feasts()
+
+    def _g_date(self, b_month, b_day):
+        # The first day of the month starts at sunset on the start date.
+        return datetime.date.fromordinal(self.month_starts[b_month] + b_day)
+
+    def _has_day(self, b_month, b_day):
+        # Until the next month has started, the length of the month isn't
+        # known, so only the days every month has can be counted on.
+        next_start = self.month_starts.get(b_month + 1)
+        if next_start is None:
+            return b_day <= MIN_MONTH_LENGTH
+        return b_day <= next_start - self.month_starts[b_month]
+
+    def _find_firstfruits(self):
+        if 1 not in self.month_starts:
+            return
+        # Iterate over the days following unleavened bread until you find
+        # the 1st day of the week.
+        for b_day in range(16, 23):
+            if self._g_date(1, b_day).weekday() == 6:
+                break
+        self.firstfruits = (self.year, 1, b_day)
+        self.firstfruits_date = self._g_date(1, b_day)
+
+        self.shavuot_date = self.firstfruits_date + datetime.timedelta(
+            days=49)
+        shavuot_ordinal = self.shavuot_date.toordinal()
+        for b_month in sorted(self.month_starts, reverse=True):
+            if self.month_starts[b_month] < shavuot_ordinal:
+                b_day = shavuot_ordinal - self.month_starts[b_month]
+                # Shavuot may fall in a month that isn't in the data yet.
+                if self._has_day(b_month, b_day):
+                    self.shavuot = (self.year, b_month, b_day)
+                break
+        self.omer = (self.firstfruits_date, self.shavuot_date)
+
+    def _find_hanukkah(self):
+        if 9 not in self.month_starts:
+            return
+        hanukkah = [((self.year, ) + pf, feast[0])
+                    for pf, feast in sorted(FIXED_FEAST_DAYS.items())
+                    if pf[0] == 9]
+        # A short month 9 doesn't have all the days listed for it.
+        hanukkah = [day for day in hanukkah if self._has_day(9, day[0][2])]
+        if 10 in self.month_starts:
+            p_length = self.month_starts[10] - self.month_starts[9]
+            if p_length <= 28:
+                later_days = HANUKKAH_REALLY_SHORT_9
+            elif p_length == 29:
+                later_days = HANUKKAH_SHORT_9
+            else:
+                later_days = HANUKKAH_LONG_9
+            hanukkah.extend(((self.year, ) + pf, feast[0])
+                            for pf, feast in sorted(later_days.items()))
+        self.hanukkah = tuple(hanukkah)
+
+    def _fill_feasts(self):
+        for pf, feast in self.fixed_feasts.items():
+            # Between the 16th and the 22nd of the first month, only the
+            # feast of Firstfruits is looked for.
+            if pf[0] == 1 and 15 < pf[1] < 23:
+                continue
+            self.feasts[pf] = feast
+        for b_date, name in self.hanukkah:
+            self.feasts[b_date[1:]] = (True, False, name)
+        if self.firstfruits is not None:
+            self.feasts[self.firstfruits[1:]] = (
+                True, False, 'Bikkurim / "The feast of Firstfruits"')
+        if self.shavuot is not None:
+            self.feasts[self.shavuot[1:]] = (True, True,
+                                             'Shavuot / "The feast of Weeks"')
+
+        feast_days = []
+        for (b_month, b_day), feast in self.feasts.items():
+            # Leave out the days a short month doesn't have.
+            if not self._has_day(b_month, b_day):
+                continue
+            feast_days.append((self.month_starts[b_month] + b_day - 1,
+                               b_month, b_day) + feast)
+        self.feast_days = tuple(sorted(feast_days))
+
+    def feast_status(self, b_month, b_day):
+        """Tests if a day of the year is a feast day.
+
+        Returns a tuple of (is_hfd, is_hfs, feast_name, omer_count)."""
+        is_hfd, is_hfs, feast_name = self.feasts.get((b_month, b_day),
+                                                     (False, False, None))
+        omer_count = None
+        if self.firstfruits is not None and (b_month in (2, 3) or
+                                             (b_month == 1 and b_day > 15)):
+            omer_count = (self.month_starts[b_month] + b_day -
+                          self.firstfruits_date.toordinal())
+        return (is_hfd, is_hfs, feast_name, omer_count)
+
+
+# The YearCalendar objects most recently asked for by `year_calendar`.
+YEAR_CALENDARS = LRUCache(maxsize=64)
+instrument.register_cache('year_calendar', YEAR_CALENDARS)
+
+
+def year_calendar(b_year, snapshot=None):
+    """Returns the YearCalendar of b_year, built once per version of data.
+
+    snapshot is the `data.DataSnapshot` to use, by default the current."""
+    if snapshot is None:
+        snapshot = data.MOON_DATA.snapshot()
+    return YEAR_CALENDARS.get_or_compute(
+        (snapshot.version, b_year),
+        lambda: YearCalendar(b_year, snapshot.month_index))
+
+
+def feast_status(b_year, b_month, b_day, snapshot=None):
+    """Tests if a biblical date is a feast day.
+
+    Returns a tuple of (is_hfd, is_hfs, feast_name, omer_count)."""
+    return year_calendar(b_year, snapshot).feast_status(b_month, b_day)
+
+
+def last_moon_check(snapshot=None):
+    """Returns the last moon sighted and its key, as of the data loaded."""
+    if snapshot is None:
+        snapshot = data.MOON_DATA.snapshot()
+    last_moon = snapshot.last_moon
     last_moon_key = list(last_moon.keys())[0]
     return (last_moon, last_moon_key)
 
 
+# A biblical day, as yielded by `iter_days`. g_date is the gregorian date of
+# the daylight part of the day and sunset the time that the day ends.
+DayRecord = collections.namedtuple(
+    'DayRecord', ('g_date', 'year', 'month', 'day', 'weekday', 'is_known',
+                  'sabbath', 'weekly_sabbath', 'high_feast_day',
+                  'holy_day_of_rest', 'feast_name', 'omer_count', 'sunset'))
+
+
+def iter_days(start, end, location, geocoder='astral'):
+    """Yields a DayRecord for every gregorian date from start to end.
+
+    Both start and end are included. Each record describes the biblical day
+    during daylight on that date. location is a city name, an astral Location
+    or a BibLocation.
+
+    The month, weekday and year calendar are carried over from one day to
+    the next rather than worked out again, so memory use stays the same
+    however long the range is. The sunsets are not kept in the sun cache,
+    so a long range doesn't push out the dates asked for the most."""
+    location = resolve_location(location, geocoder)
+    if isinstance(start, datetime.datetime):
+        start = start.date()
+    if isinstance(end, datetime.datetime):
+        end = end.date()
+
+    # The same data all the way, even if it is refreshed meanwhile.
+    snapshot = data.MOON_DATA.snapshot()
+    month_index = snapshot.month_index
+    position = month_index.find(start)
+    ordinal = start.toordinal()
+    weekday = start.weekday()
+    calendar = None
+    while ordinal <= end.toordinal():
+        # The first day of the next month has daylight on the day after
+        # the date in MOONS.
+        next_position = position + 1
+        if (next_position < len(month_index)
+                and month_index.ordinals[next_position] < ordinal):
+            position = next_position
+        b_day = ordinal - month_index.ordinals[position]
+        if b_day > 30:
+            raise Exception('Day of Month greater than 30.')
+        b_year, b_month = divmod(month_index.keys[position], 100)
+        if calendar is None or calendar.year != b_year:
+            calendar = year_calendar(b_year, snapshot)
+        is_hfd, is_hfs, feast_name, omer_count = calendar.feast_status(
+            b_month, b_day)
+        b_weekday = BIB_WEEKDAYS[weekday]
+        is_ws = b_weekday == '7th'
+        g_date = datetime.date.fromordinal(ordinal)
+
+        yield DayRecord(g_date, b_year, b_month, b_day, b_weekday,
+                        bool(month_index.is_known[position]),
+                        True if is_hfs is True else is_ws, is_ws, is_hfd,
+                        is_hfs, feast_name, _omer_name(omer_count),
+                        astro.sun_events(location, g_date, cache=False)[1])
+
+        ordinal += 1
+        weekday = (weekday + 1) % 7
+
+
+def _localize(g_time, location):
+    """Returns g_time as an aware datetime in the time zone of location.
+
+    Naive datetimes are taken as local time, the same way `BibLocation`
+    does it. Plain dates are taken at 12 o'clock."""
+    if not isinstance(g_time, datetime.datetime):
+        g_time = datetime.datetime(g_time.year, g_time.month, g_time.day, 12)
+    if g_time.tzinfo is None:
+        return g_time.replace(tzinfo=location.tzinfo)
+    return g_time.astimezone(location.tz)
+
+
+def _omer_name(omer_count):
+    """Returns the day of the omer count as a string, if any."""
+    if omer_count is not None and 0 <= omer_count <= 49:
+        return COUNT[omer_count]
+    return None
+
+
+# Geocoders shared by all BibLocation objects, by name.
+_GEOCODERS = {}
+_GEOCODERS_LOCK = threading.Lock()
+
+
+def get_geocoder(geocoder='astral'):
+    r"""Returns the Astral or Google Geocoder, shared by the whole process.
+
+    You need to choose whether to use Astral or Google Geocoder.
+    To use the GoogleGeocoder you have to agree to GoogleGeocoder
+    terms and license found here:
+    https://developers.google.com/maps/documentation/geocoding/usage-limits#terms-of-use-restrictions"""
+    try:
+        return _GEOCODERS[geocoder]
+    except KeyError:
+        pass
+    with _GEOCODERS_LOCK:
+        if geocoder not in _GEOCODERS:
+            # 'astral' and 'offline' both look in the table of locations
+            # that comes with astral, through an index that is only built
+            # once per process and never touches the network.
+            if geocoder == 'astral' or geocoder == 'offline':
+                geo = Astral(geocoder=OfflineGeocoder)
+            elif geocoder == 'google':
+                geo = GoogleGeocoder()
+            else:
+                raise Exception('Unknown geocoder: {}'.format(geocoder))
+            geo.solar_depression = 'civil'
+            _GEOCODERS[geocoder] = geo
+        return _GEOCODERS[geocoder]
+
+
+def _find_location(geo, city_name):
+    """Looks up city_name with the geocoder geo."""
+    try:
+        try:
+            location = geo[city_name]
+        except AstralError:
+            print('Please wait...')
+            url = 'https://www.avivcalendar.com/latest-data'
+            connection_msg = ('Unable to connect to {}\n'
+                              'Please check your internet connection.'.format(
+                                  url))
+            try:
+                if urllib.request.urlopen(url).code != 200:
+                    raise Exception(connection_msg)
+            except urllib.error.URLError:
+                raise Exception(connection_msg)
+            time.sleep(2)
+            try:
+                location = geo[city_name]
+            except AstralError:
+                print('Please wait some more...')
+                time.sleep(2)
+                try:
+                    location = geo[city_name]
+                except AstralError:
+                    raise Exception(
+                        'The Geocoder ({}) is having a fit.'
+                        # 'GoogleGeocoder is having a fit. '
+                        "Or the location really can't be found.".format(geo))
+    except KeyError:
+        raise Exception('That city is not found. Please try another.')
+    return location
+
+
+def resolve_location(city_name, geocoder='astral'):
+    """Returns the astral Location of city_name.
+
+    Each city is only looked up once per process and geocoder, after that
+    it's taken from LOCATION_POOL. An astral Location or a BibLocation can
+    be passed instead of a name, and is used as it is."""
+    if isinstance(city_name, Location):
+        return city_name
+    if isinstance(city_name, BibLocation):
+        return city_name.location
+    geo = get_geocoder(geocoder)
+    return LOCATION_POOL.get(city_name, geocoder,
+                             lambda name: _find_location(geo, name))
+
+
+class BibSabbath:
+    """Whether a biblical day is a sabbath or a feast, as `b_time.sabbath`.
+
+    feast_name is None unless high_feast_day is True."""
+
+    __slots__ = ('sabbath', 'high_feast_day', 'holy_day_of_rest',
+                 'weekly_sabbath', 'feast_name', 'omer_count')
+
+    def __init__(self, b_sabbath, is_hfd, is_hfs, is_ws, feast_name,
+                 omer_count):
+        self.sabbath = b_sabbath
+        self.high_feast_day = is_hfd
+        self.holy_day_of_rest = is_hfs
+        self.weekly_sabbath = is_ws
+        self.feast_name = feast_name if is_hfd is True else None
+        self.omer_count = _omer_name(omer_count)
+
+    def __repr__(self):
+        return 'BibSabbath({})'.format(', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name in self.__slots__))
+
+
+class BibDay:
+    """A biblical day, as `BibTime.b_time`."""
+
+    __slots__ = ('year', 'month', 'month_name', 'month_trad_name', 'day',
+                 'day_name', 'weekday', 'month_start_time', 'is_known',
+                 'sabbath')
+
+    def __init__(self,
+                 b_year,
+                 b_month,
+                 b_month_name,
+                 b_month_trad_name,
+                 b_day,
+                 b_day_name,
+                 b_weekday,
+                 month_start_time,
+                 is_known,
+                 sabbath=None):
+        self.year = b_year
+        self.month = b_month
+        self.month_name = b_month_name
+        self.month_trad_name = b_month_trad_name
+        self.day = b_day
+        self.day_name = b_day_name
+        self.weekday = b_weekday
+        self.month_start_time = month_start_time
+        self.is_known = is_known
+        self.sabbath = sabbath
+
+    def __repr__(self):
+        return 'BibDay({})'.format(', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name in self.__slots__))
+
+
+# The columns of `to_columns`: those of BibDay, with those of BibSabbath in
+# place of sabbath.
+BIB_DAY_COLUMNS = BibDay.__slots__[:-1] + BibSabbath.__slots__
+
+
+def to_columns(b_days):
+    """Turns an iterable of BibDay into a dict with one list per column, as
+    listed in BIB_DAY_COLUMNS."""
+    columns = {name: [] for name in BIB_DAY_COLUMNS}
+    day_columns = [(name, columns[name]) for name in BibDay.__slots__[:-1]]
+    sabbath_columns = [(name, columns[name]) for name in BibSabbath.__slots__]
+    for b_day in b_days:
+        for name, column in day_columns:
+            column.append(getattr(b_day, name))
+        for name, column in sabbath_columns:
+            column.append(getattr(b_day.sabbath, name))
+    return columns
+
+
 class BibLocation:
     """Define a location. Takes city_name as argument.
 
+       city_name can also be an astral Location that has already been
+       looked up.
+
        Also takes optional time as argument (which will
        usually be passed on from BibTime.)
        Arguments: city_name, geocoder, year, month, day, hour.
@@ -438,57 +770,16 @@ class BibLocation:
                  month=None,
                  day=None,
                  hour=None):
-        try:
-            r"""Creates an object using the Astral or Google Geocoder.
-
-            You need to choose whether to use Astral or Google Geocoder.
-            To use the GoogleGeocoder you have to agree to GoogleGeocoder
-            terms and license found here:
-            https://developers.google.com/maps/documentation/geocoding/usage-limits#terms-of-use-restrictions"""
-
-            if geocoder == 'astral':
-                self.geo = Astral()
-            elif geocoder == 'google':
-                self.geo = GoogleGeocoder()
-            else:
-                raise Exception('Unknown geocoder: {}'.format(geocoder))
-
-            self.geo.solar_depression = 'civil'
-            logging.debug('city_name is %s', city_name)
-            try:
-                location = self.geo[city_name]
-            except AstralError:
-                print('Please wait...')
-                url = 'https://www.avivcalendar.com/latest-data'
-                connection_msg = (
-                    'Unable to connect to {}\n'
-                    'Please check your internet connection.'.format(url))
-                try:
-                    if urllib.request.urlopen(url).code != 200:
-                        raise Exception(connection_msg)
-                except urllib.error.URLError:
-                    raise Exception(connection_msg)
-                time.sleep(2)
-                try:
-                    location = self.geo[city_name]
-                except AstralError:
-                    print('Please wait some more...')
-                    time.sleep(2)
-                    try:
-                        location = self.geo[city_name]
-                    except AstralError:
-                        raise Exception(
-                            'The Geocoder ({}) is having a fit.'
-                            # 'GoogleGeocoder is having a fit. '
-                            "Or the location really can't be found.".format(
-                                self.geo))
-        except KeyError:
-            raise Exception('That city is not found. Please try another.')
-        self.location = location
+        self.geo = get_geocoder(geocoder)
+        if trace.ENABLED:
+            trace.trace('city_name is %s', city_name)
+        with instrument.stage('geocode'):
+            self.location = resolve_location(city_name, geocoder)
 
         # If no date input it given, defaults to the current date and time.
         if year == month == day == hour == None:
-            logging.debug('No date input given.')
+            if trace.ENABLED:
+                trace.trace('No date input given.')
             self.g_time = self._set_g_time_now()
         else:
             year = 2018 if year is None else year
@@ -506,7 +797,8 @@ class BibLocation:
             'daylight': None
         }
 
-        self.sun_status()
+        with instrument.stage('sun'):
+            self.sun_status()
 
     def _get_entry(self):
         return 'The city name is set to {}'.format(self.location)
@@ -529,9 +821,41 @@ class BibLocation:
         return g_time
 
     def update_g_time(self):
-        """Updates the g_time to reflect current time."""
-        self.g_time = self._set_g_time_now()
-        self.sun_status()
+        """Updates the g_time to reflect current time.
+
+        The sun is only looked at again once it has risen or set since the
+        last update, or the date has changed."""
+        g_time = self._set_g_time_now()
+        sun_unchanged = self._sun_unchanged(g_time)
+        self.g_time = g_time
+        if not sun_unchanged:
+            with instrument.stage('sun'):
+                self.sun_status()
+
+    def _sun_unchanged(self, g_time):
+        """Returns True if sun_info is still right at g_time."""
+        old_time = self.g_time
+        sun_info = self.sun_info
+        if sun_info['sunset'] is None or g_time < old_time or \
+                g_time.date() != old_time.date():
+            return False
+        if sun_info['has_risen'] is not True:
+            return g_time < sun_info['sunrise']
+        if sun_info['has_set'] is not True:
+            return g_time < sun_info['sunset']
+        return True
+
+    @property
+    def next_transition(self):
+        """The next sunrise or sunset after g_time."""
+        if self.sun_info['sunset'] is None:
+            self.sun_status()
+        if self.sun_info['has_risen'] is not True:
+            return self.sun_info['sunrise']
+        if self.sun_info['has_set'] is not True:
+            return self.sun_info['sunset']
+        tomorrow = self.g_time.date() + datetime.timedelta(days=1)
+        return astro.sun_events(self.location, tomorrow)[0]
 
     def _set_g_time_now(self):
         """Updates the g_datetime to reflect current time."""
@@ -542,10 +866,10 @@ class BibLocation:
     def sun_status(self):
         """Updates the sunrise and sunset status based on location and time."""
         g_time = self.g_time
-        loc_sun = self.location.sun(date=g_time, local=True)
+        sunrise, sunset = astro.sun_events(self.location, g_time.date())
 
-        has_set = g_time >= loc_sun['sunset']
-        has_risen = g_time >= loc_sun['sunrise']
+        has_set = g_time >= sunset
+        has_risen = g_time >= sunrise
 
         def check_daylight(has_set, has_risen):
             """Checks if there is still daylight."""
@@ -557,8 +881,8 @@ class BibLocation:
 
         daylight = check_daylight(has_set, has_risen)
 
-        self.sun_info['sunrise'] = loc_sun['sunrise']
-        self.sun_info['sunset'] = loc_sun['sunset']
+        self.sun_info['sunrise'] = sunrise
+        self.sun_info['sunset'] = sunset
         self.sun_info['has_set'] = has_set
         self.sun_info['has_risen'] = has_risen
         self.sun_info['daylight'] = daylight
@@ -569,6 +893,13 @@ class BibLocation:
         self.sun_status()
 
 
+# The columns of `BibTime.for_locations` that are the same for every
+# location on the same biblical day.
+_FOR_LOCATIONS_DAY_COLUMNS = ('year', 'month', 'day', 'weekday', 'is_known',
+                              'sabbath', 'weekly_sabbath', 'high_feast_day',
+                              'holy_day_of_rest', 'feast_name', 'omer_count')
+
+
 class BibTime:
     """Define biblical time and date.
 
@@ -587,42 +918,203 @@ class BibTime:
                  month=None,
                  day=None,
                  hour=None):
-        try:
-            b_location = BibLocation(city, geocoder, year, month, day, hour)
-        except ValueError:
-            raise Exception('Error: Not a valid string.')
-        self.b_location = b_location
-        self._check_db_status()
-        self.aviv_barley = None
-        self.b_time = self._set_b_time()
+        with instrument.conversion():
+            try:
+                b_location = BibLocation(city, geocoder, year, month, day,
+                                         hour)
+            except ValueError:
+                raise Exception('Error: Not a valid string.')
+            self.b_location = b_location
+            with instrument.stage('db_check'):
+                self._check_db_status()
+            self.aviv_barley = None
+            self.b_time = self._set_b_time()
+            self._b_day_key = self._get_b_day_key()
 
     def update_time(self):
-        """Update time to current."""
-        self.b_location.update_g_time()
-        self._check_db_status()
-        self.b_time = self._set_b_time()
+        """Update time to current.
+
+        Only what has changed is calculated again: the sun once it has
+        risen or set, and b_time once the biblical day has changed or new
+        moon data has been loaded. Use next_transition to know when to call
+        it next."""
+        with instrument.conversion():
+            self.b_location.update_g_time()
+            with instrument.stage('db_check'):
+                self._check_db_status()
+            b_day_key = self._get_b_day_key()
+            if b_day_key != self._b_day_key:
+                self.b_time = self._set_b_time()
+                self._b_day_key = b_day_key
+
+    @property
+    def next_transition(self):
+        """The next sunrise or sunset, when either the biblical day or the
+        daylight changes."""
+        return self.b_location.next_transition
+
+    def _get_b_day_key(self):
+        # The biblical day starts at sunset, so it stays the same over
+        # midnight.
+        b_location = self.b_location
+        return (b_location.g_time.toordinal() +
+                bool(b_location.sun_info['has_set']),
+                data.MOON_DATA.version)
+
+    @classmethod
+    def convert_many(cls, dates, location, geocoder='astral'):
+        """Converts many gregorian dates for one location at once.
+
+        dates can be any iterable of datetime.datetime objects, or a NumPy
+        array of datetime64. Naive datetimes are taken as the local time at
+        the location, just like the arguments to BibTime. Plain dates are
+        taken at 12 o'clock. location is a city name, an astral Location or
+        a BibLocation.
+
+        The location is only looked up once, the sun is taken from the sun
+        cache and the months are all found in one walk of the month index.
+        Unlike BibTime, the month of today is found the same way as any other
+        date, not from the last moon reported.
+
+        Returns a dict with one list per column, in the order of dates:
+        g_time, year, month, day, weekday, is_known, sabbath, weekly_sabbath,
+        high_feast_day, holy_day_of_rest, feast_name and omer_count."""
+        location = resolve_location(location, geocoder)
+        if hasattr(dates, 'dtype'):
+            # NumPy arrays of datetime64 become lists of datetime.datetime.
+            dates = dates.astype('datetime64[us]').tolist()
+
+        g_times = [_localize(date, location) for date in dates]
+        g_dates = [g_time.date() for g_time in g_times]
+        has_set = [
+            g_time >= astro.sun_events(location, g_date)[1]
+            for g_time, g_date in zip(g_times, g_dates)
+        ]
+        snapshot = data.MOON_DATA.snapshot()
+        month_index = snapshot.month_index
+        positions = month_index.find_many(g_dates, has_set)
+
+        columns = {
+            name: []
+            for name in ('g_time', 'year', 'month', 'day', 'weekday',
+                         'is_known', 'sabbath', 'weekly_sabbath',
+                         'high_feast_day', 'holy_day_of_rest', 'feast_name',
+                         'omer_count')
+        }
+        feasts = {}
+        for g_time, g_date, sun_has_set, position in zip(
+                g_times, g_dates, has_set, positions):
+            key = month_index.keys[position]
+            b_year, b_month = divmod(key, 100)
+            start_ordinal = month_index.ordinals[position]
+            b_day = g_date.toordinal() - start_ordinal + (1 if sun_has_set
+                                                           else 0)
+            if b_day > 30:
+                raise Exception('Day of Month greater than 30.')
+            b_date = (b_year, b_month, b_day)
+            if b_date not in feasts:
+                feasts[b_date] = feast_status(b_year, b_month, b_day,
+                                              snapshot)
+            is_hfd, is_hfs, feast_name, omer_count = feasts[b_date]
+            b_weekday = BIB_WEEKDAYS[g_time.weekday() + (1 if sun_has_set
+                                                         else 0)]
+            is_ws = b_weekday == '7th'
+
+            columns['g_time'].append(g_time)
+            columns['year'].append(b_year)
+            columns['month'].append(b_month)
+            columns['day'].append(b_day)
+            columns['weekday'].append(b_weekday)
+            columns['is_known'].append(bool(month_index.is_known[position]))
+            columns['sabbath'].append(True if is_hfs is True else is_ws)
+            columns['weekly_sabbath'].append(is_ws)
+            columns['high_feast_day'].append(is_hfd)
+            columns['holy_day_of_rest'].append(is_hfs)
+            columns['feast_name'].append(feast_name if is_hfd else None)
+            columns['omer_count'].append(_omer_name(omer_count))
+        return columns
+
+    @classmethod
+    def for_locations(cls, instant, locations, geocoder='astral'):
+        """Converts one instant at many locations at once.
+
+        instant is a datetime.datetime, taken as UTC if naive. locations are
+        city names, astral Locations or BibLocations.
+
+        The month and the feasts don't depend on the location, only on the
+        local date and whether the sun has set there, so they are worked out
+        once for each such day rather than once per location. For each
+        location only the local time and the sun are looked at.
+
+        Returns a dict with one list per column, in the order of locations:
+        location, g_time, sunset, year, month, day, weekday, is_known,
+        sabbath, weekly_sabbath, high_feast_day, holy_day_of_rest,
+        feast_name and omer_count. sunset is that of the local date, when
+        the next biblical day starts or started."""
+        if instant.tzinfo is None:
+            instant = instant.replace(tzinfo=datetime.timezone.utc)
+        snapshot = data.MOON_DATA.snapshot()
+        month_index = snapshot.month_index
+
+        columns = {
+            name: []
+            for name in ('location', 'g_time', 'sunset', 'year', 'month',
+                         'day', 'weekday', 'is_known', 'sabbath',
+                         'weekly_sabbath', 'high_feast_day',
+                         'holy_day_of_rest', 'feast_name', 'omer_count')
+        }
+        # ordinal: the columns from year to omer_count.
+        b_days = {}
+        for city in locations:
+            location = resolve_location(city, geocoder)
+            g_time = instant.astimezone(location.tz)
+            g_date = g_time.date()
+            sunset = astro.sun_events(location, g_date)[1]
+            sun_has_set = g_time >= sunset
+            # Once the sun has set, it is the biblical day that has daylight
+            # on the next date.
+            ordinal = g_date.toordinal() + (1 if sun_has_set else 0)
+            row = b_days.get(ordinal)
+            if row is None:
+                b_date = datetime.date.fromordinal(ordinal)
+                position = month_index.find(b_date)
+                b_year, b_month = divmod(month_index.keys[position], 100)
+                b_day = ordinal - month_index.ordinals[position]
+                if b_day > 30:
+                    raise Exception('Day of Month greater than 30.')
+                is_hfd, is_hfs, feast_name, omer_count = feast_status(
+                    b_year, b_month, b_day, snapshot)
+                b_weekday = BIB_WEEKDAYS[b_date.weekday()]
+                is_ws = b_weekday == '7th'
+                row = (b_year, b_month, b_day, b_weekday,
+                       bool(month_index.is_known[position]),
+                       True if is_hfs is True else is_ws, is_ws, is_hfd,
+                       is_hfs, feast_name if is_hfd else None,
+                       _omer_name(omer_count))
+                b_days[ordinal] = row
+
+            columns['location'].append(city)
+            columns['g_time'].append(g_time)
+            columns['sunset'].append(sunset)
+            for name, value in zip(_FOR_LOCATIONS_DAY_COLUMNS, row):
+                columns[name].append(value)
+        return columns
 
     def _check_db_status(self):
-        """Rebuild the database if moon has recently renewed
-        or if no database exists, or if it's been more than 1
-        day since last modification."""
-        m_phase = self.b_location.location.moon_phase(
-            date=datetime.datetime.now())
-        logging.debug('current m_phase at time of test is %s', m_phase)
-
-        if m_phase <= 2:
-            combine_data()
-        elif DB_EXISTS is False:
-            combine_data()
-        # Only renew database if it's been more than one day since last mod.
-        elif datetime.datetime.now() - DB_MOD_TIME > datetime.timedelta(
-                days=1):
-            combine_data()
+        """Rebuild the database in the background if moon has recently
+        renewed, if no database exists, or if it's been more than 1 day
+        since last modification. Never waits for the rebuild."""
+        data.REFRESHER.maybe_refresh()
 
     def _set_b_time(self):
         """Tries to calculate the biblical time."""
+        # Checked once, rather than at every step.
+        tracing = trace.ENABLED
+        # All of the data comes from the same snapshot, even if it is
+        # refreshed meanwhile.
+        snapshot = data.MOON_DATA.snapshot()
 
-        lmoon = last_moon_check()
+        lmoon = last_moon_check(snapshot)
         last_moon = lmoon[0]
         last_moon_key = lmoon[1]
 
@@ -649,18 +1141,19 @@ class BibTime:
             return b_weekday
 
         def _get_moon_phases():
-            logging.debug('Entering the "_test_current" function.')
+            if tracing:
+                trace.trace('Entering the "_test_current" function.')
             # Test wether or not we are looking for a current date.
             today = datetime.datetime.now(self.b_location.location.tz).replace(
                 tzinfo=self.b_location.location.tzinfo).date()
             date_to_test = self.b_location.g_time.date()
-            m_phase_today = self.b_location.location.moon_phase(date=today)
-            m_phase_date_to_test = self.b_location.location.moon_phase(
-                date=date_to_test)
+            m_phase_today = astro.moon_phase(today)
+            m_phase_date_to_test = astro.moon_phase(date_to_test)
             return (today, m_phase_today, date_to_test, m_phase_date_to_test)
 
         def _test_current():
-            m_phases = _get_moon_phases()
+            with instrument.stage('moon_phase'):
+                m_phases = _get_moon_phases()
             today = m_phases[0]
             m_phase_today = m_phases[1]
             date_to_test = m_phases[2]
@@ -684,87 +1177,38 @@ class BibTime:
             return cur
 
         current = _test_current()
-        logging.debug('current is now %s', current)
+        if tracing:
+            trace.trace('current is now %s', current)
 
         def _find_month(unknown_moon):
-            i = 0
-            potential_keys = []
-            for key in sorted(list(MOONS.keys())):
-                known_moon = datetime.date(MOONS[key][2], MOONS[key][3],
-                                           MOONS[key][4])
-                i += 1
-                logging.debug('unknown_moon is %s', unknown_moon)
-                if unknown_moon == known_moon:
-                    logging.debug('stage 1')
-                    logging.debug('known_moon is %s', known_moon)
-                    logging.debug('unknown_moon is %s', unknown_moon)
-                    logging.debug('known_moon equals unknown_moon')
-                    # Since the dates in the reference list MOONS is based
-                    # on what gregorian date the biblical day STARTS, it's
-                    # necessary to check if the sun has set. Otherwhise
-                    # the month hasn't yet actually begun and the previous
-                    # month is still the correct one.
-                    if self.b_location.sun_info['has_set'] is True:
-                        logging.debug('returning key %s', key)
-                        return key
-                    else:
-                        continue
-                elif unknown_moon < known_moon:
-                    logging.debug('stage 2')
-                    logging.debug('known_moon is %s', known_moon)
-                    logging.debug('unknown_moon is %s', unknown_moon)
-                    logging.debug('known_moon is later than unknown_moon')
-                    continue
-                elif unknown_moon > known_moon:
-                    logging.debug('stage 3')
-                    logging.debug('known_moon is %s', known_moon)
-                    logging.debug('unknown_moon is %s', unknown_moon)
-                    delta = unknown_moon - known_moon
-                    logging.debug('delta is %s', delta)
-                    if delta <= datetime.timedelta(days=29):
-                        logging.debug('stage 5')
-                        logging.debug('saving potential key %s', key)
-                        potential_keys.insert(0, key)
-                        continue
-                    elif delta == datetime.timedelta(days=30):
-                        logging.debug('stage 6')
-                        logging.debug('saving potential key %s', key)
-                        potential_keys.insert(0, key)
-                        continue
-                    elif delta > datetime.timedelta(days=30):
-                        logging.debug('stage 7')
-                        logging.debug('delta (%s) is greater than 30', delta)
-                        continue
-                    continue
-                logging.debug('potential key = %s', potential_keys[0])
-            try:
-                if potential_keys[0]:
-                    logging.debug(
-                        'returning previously tested potential key %s',
-                        potential_keys[0])
-                    return potential_keys[0]
-            except IndexError:
-                logging.debug('no potential key found')
-                # key = None
-                # return key
-                raise Exception('No potential month found')
+            # Since the dates in the reference list MOONS is based on what
+            # gregorian date the biblical day STARTS, it's necessary to check
+            # if the sun has set. Otherwhise the month hasn't yet actually
+            # begun and the previous month is still the correct one.
+            key = snapshot.month_index.find_key(
+                unknown_moon, self.b_location.sun_info['has_set'])
+            if tracing:
+                trace.trace('returning key %s', key)
+            return key
 
         def _get_moon_from_date():
             # If current is True, then try to find out the gregorian date of
             # the month using the last_moon_key.
             if current is True:
-                g_month = datetime_from_key(last_moon_key)
+                g_month = datetime_from_key(last_moon_key, snapshot)
                 # If no such month exists in the database we need to try to
                 # find the one that it most likely is.
                 year = last_moon[last_moon_key][0]
                 month = last_moon[last_moon_key][1]
                 if g_month is None:
                     unknown_moon = self.b_location.g_time.date()
-                    logging.debug('g_month is None, trying unknown_moon. '
-                                  'unknown_moon is %s', unknown_moon)
                     u_key = _find_month(unknown_moon)
-                    logging.debug('u_key is now %s', u_key)
-                    g_month = datetime_from_key(u_key)
+                    if tracing:
+                        trace.trace(
+                            'g_month is None, trying unknown_moon. '
+                            'unknown_moon is %s, u_key is now %s',
+                            unknown_moon, u_key)
+                    g_month = datetime_from_key(u_key, snapshot)
                     tmpstring = str(u_key)
                     year = int(tmpstring[0:4])
                     month = int(tmpstring[4::])
@@ -772,45 +1216,40 @@ class BibTime:
 
             else:
                 unknown_moon = self.b_location.g_time.date()
-                logging.debug('unknown_moon is %s', unknown_moon)
                 u_key = _find_month(unknown_moon)
-                logging.debug('u_key is now %s', u_key)
-                g_month = datetime_from_key(u_key)
+                if tracing:
+                    trace.trace('unknown_moon is %s, u_key is now %s',
+                                unknown_moon, u_key)
+                g_month = datetime_from_key(u_key, snapshot)
                 tmpstring = str(u_key)
                 year = int(tmpstring[0:4])
                 month = int(tmpstring[4::])
                 return (g_month, year, month)
 
-        x_month = _get_moon_from_date()
+        with instrument.stage('find_month'):
+            x_month = _get_moon_from_date()
         is_known = x_month[0][1]
         b_year = x_month[1]
         b_month = x_month[2]
-
-        x_month_year = x_month[0][0].year
-        logging.debug('x_month_year is %s', x_month_year)
-        x_month_month = x_month[0][0].month
-        logging.debug('x_month_month is %s', x_month_month)
-        x_month_day = x_month[0][0].day
-        logging.debug('x_month_day is %s', x_month_day)
-
-        def _set_month_start_time(year, month, day):
-            month_start_time = datetime.datetime(year, month, day).replace(
-                tzinfo=self.b_location.location.tzinfo, microsecond=0)
-            return month_start_time
-
-        def _set_day_of_month(month_start_time):
-            time_lapsed = self.b_location.g_time - month_start_time
-            day = time_lapsed.days
-            if self.b_location.sun_info['has_set'] is True:
-                day += 1
-            return day
-
-        # TODO: Month start time should take sunset time into consideration
-        # to give a more exact datetime.datetime object.
-        month_start_time = _set_month_start_time(x_month_year, x_month_month,
-                                                 x_month_day)
-        b_day = _set_day_of_month(month_start_time)
-        logging.debug('b_day (day of month) is %s', b_day)
+        if tracing:
+            trace.trace('x_month is %s', x_month[0][0])
+
+        # The month starts at sunset in Jerusalem on the date in MOONS, as
+        # worked out in advance by the month index. Where we are, the day
+        # of the month still changes at the local sunset.
+        month_index = snapshot.month_index
+        position = month_index.positions.get(b_year * 100 + b_month)
+        if position is not None:
+            month_start = month_index.start_time(position)
+        else:
+            month_start = astro.month_start_timestamp(x_month[0][0])
+        month_start_time = datetime.datetime.fromtimestamp(
+            month_start, self.b_location.location.tz)
+        b_day = self.b_location.g_time.toordinal() - x_month[0][0].toordinal()
+        if self.b_location.sun_info['has_set'] is True:
+            b_day += 1
+        if tracing:
+            trace.trace('b_day (day of month) is %s', b_day)
 
         if b_day > 30:
             raise Exception('Day of Month greater than 30.')
@@ -819,92 +1258,19 @@ class BibTime:
         b_month_name = COUNT[b_month - 1]
         b_month_trad_name = TRAD_MONTH_NAMES[b_month - 1]
 
-        b_day = _set_day_of_month(month_start_time)
-
         if b_month >= 11:
-            self.aviv_barley = AVIV_BARLEY
-
-        def _get_prev_month_length(b_year, b_month, month_start_time):
-            key = int(str(b_year) + '{0:0=2d}'.format(b_month))
-            p_month = datetime_from_key(key)
-            p_month = datetime.datetime(
-                p_month[0].year, p_month[0].month, p_month[0].day).replace(
-                    tzinfo=self.b_location.location.tzinfo, microsecond=0)
-            delta = month_start_time - p_month
-            logging.debug('delta is %s', delta)
-            return delta.days
-
-        def _count_the_omer(firstfruits, date):
-            omer_delta = firstfruits - date
-            logging.debug('The omer_delta is %s', omer_delta)
-            omer_count = omer_delta.days
-            logging.debug('The omer_count is %s', omer_count)
-            return omer_count
-
-        def _feast_test():
-            logging.debug('Entering _feast_test')
-            omer_count = None
-            if b_month == 1 and 15 < b_day < 23:
-                logging.debug('It is the %s month between day 16 and 22',
-                              b_month)
-                test_data = find_firstfruits(b_year, b_month, b_day)
-                hfd, hfs = test_data[1], False
-                if test_data[1] is True:
-                    name = 'Bikkurim / "The feast of Firstfruits"'
-                    omer_count = 0
-                else:
-                    name = None
-                    omer_count = _count_the_omer(
-                        datetime.date(b_year, b_month, b_day),
-                        datetime.date(test_data[0][0], test_data[0][1],
-                                      test_data[0][2]))
-            elif b_month == 1 and b_day >= 23 or b_month == 2 or b_month == 3:
-                logging.debug('It is the %s month and day %s', b_month, b_day)
-                test_data = find_firstfruits(b_year, 1, 16)
-                omer_count = _count_the_omer(
-                    datetime.date(b_year, b_month, b_day),
-                    datetime.date(test_data[0][0], test_data[0][1],
-                                  test_data[0][2]))
-                if omer_count == 49:
-                    hfd, hfs = True, True
-                    name = 'Shavuot / "The feast of Weeks"'
-                else:
-                    hfd, hfs, name = False, False, None
-            elif b_month == 9:
-                logging.debug('month %s == 9, testing for hanukkah', b_month)
-                test_data = test_is_hanukkah(b_month, b_day, None)
-                hfd = test_data[0]
-                hfs = test_data[1]
-                name = test_data[2]
-            elif b_month == 10:
-                logging.debug(
-                    'month %s == 10, testing for later days of hanukkah',
-                    b_month)
-                p_length = _get_prev_month_length(b_year, 9, month_start_time)
-                test_data = test_is_hanukkah(b_month, b_day, p_length)
-                hfd = test_data[0]
-                hfs = test_data[1]
-                name = test_data[2]
-            else:
-                logging.debug('month is %s, day is %s, testing for feasts',
-                              b_month, b_day)
-                test_data = test_is_feast(b_month, b_day)
-                hfd = test_data[0]
-                hfs = test_data[1]
-                name = test_data[2]
-            feast_data = (hfd, hfs, name, omer_count)
-            return feast_data
+            self.aviv_barley = snapshot.aviv_barley
 
-        feast_data = _feast_test()
+        with instrument.stage('feasts'):
+            feast_data = feast_status(b_year, b_month, b_day, snapshot)
 
         is_hfd = feast_data[0]
-        logging.debug('is_hfd is: %s', is_hfd)
         is_hfs = feast_data[1]
-        logging.debug('is_hfs is: %s', is_hfs)
-
         feast_name = feast_data[2]
         omer_count = feast_data[3]
-        logging.debug('omer_count is %s', omer_count)
+        if tracing:
+            trace.trace('is_hfd is: %s, is_hfs is: %s, omer_count is %s',
+                        is_hfd, is_hfs, omer_count)
 
         b_weekday = _calc_b_weekday()
         is_ws = True if b_weekday == '7th' else False
@@ -913,46 +1279,14 @@ class BibTime:
             b_sabbath = is_hfs
         else:
             b_sabbath = is_ws
-        logging.debug('b_sabbath is: %s', b_sabbath)
-
-        class BibSabbath:
-            def __init__(self, b_sabbath, is_hfd, is_hfs, is_ws, feast_name,
-                         omer_count):
-                logging.debug('creating BibSabbath object')
-                self.sabbath = b_sabbath
-                self.high_feast_day = is_hfd
-                self.holy_day_of_rest = is_hfs
-                self.weekly_sabbath = is_ws
-                if self.high_feast_day is True:
-                    self.feast_name = feast_name
-                if omer_count is None:
-                    self.omer_count = None
-                elif 0 <= omer_count <= 49:
-                    self.omer_count = COUNT[omer_count]
-                else:
-                    self.omer_count = None
-
-        class BibDay:
-            def __init__(self, b_year, b_month, b_month_name,
-                         b_month_trad_name, b_day, b_day_name, b_weekday,
-                         month_start_time, is_known):
-                logging.debug('creating BibDay object')
-                self.year = b_year
-                self.month = b_month
-                self.month_name = b_month_name
-                self.month_trad_name = b_month_trad_name
-                self.day = b_day
-                self.day_name = b_day_name
-                self.weekday = b_weekday
-                self.month_start_time = month_start_time
-                self.is_known = is_known
-
-        b_time = BibDay(b_year, b_month, b_month_name, b_month_trad_name,
-                        b_day, b_day_name, b_weekday, month_start_time,
-                        is_known)
-        b_time.sabbath = BibSabbath(b_sabbath, is_hfd, is_hfs, is_ws,
-                                    feast_name, omer_count)
-        return b_time
+        if tracing:
+            trace.trace('b_sabbath is: %s', b_sabbath)
+
+        sabbath = BibSabbath(b_sabbath, is_hfd, is_hfs, is_ws, feast_name,
+                             omer_count)
+        return BibDay(b_year, b_month, b_month_name, b_month_trad_name, b_day,
+                      b_day_name, b_weekday, month_start_time, is_known,
+                      sabbath)
 
 
 if __name__ == '__main__':
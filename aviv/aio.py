@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""An asyncio API for aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Lets aviv-calendar be used from an event loop without stalling it.
+# Example:
+#   times = await asyncio.gather(
+#       *(AsyncBibTime.create(city) for city in ('Jerusalem', 'London')))
+
+# CURRENT STATUS:
+# Everything that may block, downloading the latest data, looking up a
+# city and calculating the sun, is run in an executor. The calendar
+# itself is the same as in aviv.Aviv.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import asyncio
+import functools
+from aviv import Aviv
+from aviv import data
+
+
+async def _run(executor, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+async def preload(executor=None, wait=False, timeout=None):
+    """Loads the moon data. If there is no DB yet, it is fetched in the
+    background, and waited for if wait is True; see `data.preload`."""
+    if data.MOON_DATA.loaded and (not wait or data.db_exists()):
+        return data.MOON_DATA
+    return await _run(executor, data.preload, wait, timeout)
+
+
+async def refresh_data(executor=None):
+    """Fetches the latest data and rebuilds the DB if it has changed.
+    Returns True if the DB is up to date, False if it couldn't be
+    updated."""
+    return await _run(executor, data.refresh_data)
+
+
+async def resolve_location(city_name, geocoder='astral', executor=None):
+    """Like `Aviv.resolve_location`, but looks the city up in executor.
+
+    Cities already looked up are returned right away."""
+    if not isinstance(city_name, str):
+        return Aviv.resolve_location(city_name, geocoder)
+    return await _run(executor, Aviv.resolve_location, city_name, geocoder)
+
+
+class AsyncBibTime:
+    """The asyncio version of `Aviv.BibTime`.
+
+    Create it with `await AsyncBibTime.create(...)`, which takes the same
+    arguments as BibTime plus an optional executor. b_location and b_time
+    are those of the BibTime it wraps."""
+
+    def __init__(self, bib_time, executor=None):
+        self.bib_time = bib_time
+        self.executor = executor
+
+    @property
+    def b_location(self):
+        """The BibLocation of the wrapped BibTime."""
+        return self.bib_time.b_location
+
+    @property
+    def b_time(self):
+        """The biblical time of the wrapped BibTime."""
+        return self.bib_time.b_time
+
+    @classmethod
+    async def create(cls,
+                     city,
+                     geocoder='astral',
+                     year=None,
+                     month=None,
+                     day=None,
+                     hour=None,
+                     executor=None):
+        """Returns a new AsyncBibTime, without blocking the event loop."""
+        await preload(executor)
+        location = await resolve_location(city, geocoder, executor)
+        bib_time = await _run(executor, Aviv.BibTime, location, geocoder,
+                              year, month, day, hour)
+        return cls(bib_time, executor)
+
+    async def update_time(self):
+        """Update time to current."""
+        await _run(self.executor, self.bib_time.update_time)
+        return self
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Cached astronomical calculations for aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Sunrise and sunset are calculated by astral. Since the same cities
+# are asked for over and over, the results are kept in a cache.
+# For the cities asked for the most, the sun of a window of years can be
+# worked out in advance and kept in sun tables on disk.
+# The phase of the moon only depends on the date, and is cached by date.
+# Months start at sunset in Jerusalem.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import array
+import datetime
+import os
+import threading
+from astral import Astral
+from aviv import instrument
+from aviv.cache import LRUCache
+from aviv.geocoder import OfflineGeocoder
+from aviv.suntable import SunTable, write_sun_table
+
+# Latitude and longitude are rounded to this many decimals in the cache key.
+# 4 decimals is about 10 metres, which makes no difference to the sun.
+COORDINATE_DECIMALS = 4
+
+# The cache of sunrise and sunset, shared by the whole process.
+SUN_CACHE = LRUCache(maxsize=4096)
+
+# The cache of moon phases by date, shared by the whole process.
+MOON_PHASE_CACHE = LRUCache(maxsize=1024)
+
+instrument.register_cache('sun', SUN_CACHE)
+instrument.register_cache('moon_phase', MOON_PHASE_CACHE)
+
+# The sun tables sun_events answers from, by _location_key.
+_SUN_TABLES = {}
+
+# The moon phases of a window of years, set by precompute_moon_phases, as
+# (ordinal of the first date, array of phases).
+_PHASE_TABLE = None
+
+_astral = None
+_astral_lock = threading.Lock()
+
+# The months start at sunset here.
+MONTH_START_CITY = 'Jerusalem'
+_month_start_location = None
+
+
+def set_sun_cache_size(maxsize):
+    """Changes the number of (location, date) pairs kept in SUN_CACHE."""
+    SUN_CACHE.resize(maxsize)
+
+
+def _location_key(latitude, longitude, elevation, timezone):
+    return (round(latitude, COORDINATE_DECIMALS),
+            round(longitude, COORDINATE_DECIMALS), elevation, timezone)
+
+
+def sun_events(location, date, cache=True):
+    """Returns the (sunrise, sunset) of date at location, in local time.
+
+    location is an astral Location and date a datetime.date. They are
+    read from the sun table of location if there is one covering date, or
+    else calculated. Results are kept in SUN_CACHE, unless cache is False,
+    which is meant for walks over many dates that would only push the
+    dates asked for the most out of the cache."""
+    key = _location_key(location.latitude, location.longitude,
+                        location.elevation, location.timezone)
+
+    def _calculate():
+        table = _SUN_TABLES.get(key)
+        if table is not None:
+            events = table.events(date)
+            if events is not None:
+                return (datetime.datetime.fromtimestamp(events[0],
+                                                        location.tz),
+                        datetime.datetime.fromtimestamp(events[1],
+                                                        location.tz))
+        sun = location.sun(date=date, local=True)
+        return (sun['sunrise'], sun['sunset'])
+
+    if not cache:
+        return _calculate()
+    return SUN_CACHE.get_or_compute(key + (date, ), _calculate)
+
+
+def add_sun_table(path):
+    """Loads the sun table at path, so that sun_events answers from it.
+
+    Replaces any table already loaded for the same location. Returns the
+    SunTable."""
+    table = SunTable(path)
+    _SUN_TABLES[_location_key(table.latitude, table.longitude,
+                              table.elevation, table.timezone)] = table
+    return table
+
+
+def clear_sun_tables():
+    """Stops using the sun tables loaded. The results already in SUN_CACHE
+    are kept."""
+    _SUN_TABLES.clear()
+
+
+def sun_table_path(directory, location):
+    """Returns the path of the sun table of location in directory."""
+    return os.path.join(
+        directory, '{:.4f}_{:.4f}.avst'.format(location.latitude,
+                                               location.longitude))
+
+
+def precompute_sun_tables(locations, first_year, last_year, directory):
+    """Makes sure there is a sun table covering first_year through
+    last_year for each of locations in directory, and loads them.
+
+    locations are city names, as known by the offline geocoder, or astral
+    Locations. Tables already in directory are only written again if they
+    don't cover the years. Returns the SunTables."""
+    os.makedirs(directory, exist_ok=True)
+    first = datetime.date(first_year, 1, 1)
+    last = datetime.date(last_year, 12, 31)
+    tables = []
+    for location in locations:
+        if isinstance(location, str):
+            location = OfflineGeocoder()[location]
+        path = sun_table_path(directory, location)
+        try:
+            table = SunTable(path)
+            covered = table.first_date <= first and table.last_date >= last
+        except Exception:
+            covered = False
+        if not covered:
+            write_sun_table(path, location, first_year, last_year)
+        tables.append(add_sun_table(path))
+    return tables
+
+
+def _get_astral():
+    global _astral
+    if _astral is None:
+        with _astral_lock:
+            if _astral is None:
+                _astral = Astral(geocoder=OfflineGeocoder)
+    return _astral
+
+
+def precompute_moon_phases(first_year, last_year):
+    """Calculates the moon phase of every date from first_year through
+    last_year at once, so that `moon_phase` only needs to look them up."""
+    global _PHASE_TABLE
+    first = datetime.date(first_year, 1, 1).toordinal()
+    last = datetime.date(last_year, 12, 31).toordinal()
+    astral = _get_astral()
+    phases = array.array(
+        'b', (astral.moon_phase(datetime.date.fromordinal(ordinal))
+              for ordinal in range(first, last + 1)))
+    _PHASE_TABLE = (first, phases)
+
+
+def moon_phase(date):
+    """Returns the phase of the moon on date, from 0 (new moon) to 27.
+
+    date is a datetime.date or a datetime.datetime. The phase is the same
+    everywhere, so unlike the sun there is no location. Phases are looked
+    up in the precomputed window if date is in it, or else kept in
+    MOON_PHASE_CACHE."""
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    table = _PHASE_TABLE
+    if table is not None:
+        position = date.toordinal() - table[0]
+        if 0 <= position < len(table[1]):
+            return table[1][position]
+    return MOON_PHASE_CACHE.get_or_compute(
+        date, lambda: _get_astral().moon_phase(date))
+
+
+def month_start_timestamp(date, cache=True):
+    """Returns the sunset in MONTH_START_CITY on date, which is when a month
+    starting on date starts, as a POSIX timestamp. See `sun_events` for
+    cache."""
+    global _month_start_location
+    if _month_start_location is None:
+        _month_start_location = OfflineGeocoder()[MONTH_START_CITY]
+    return int(
+        sun_events(_month_start_location, date, cache)[1].timestamp())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Caches used by aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# A small, thread safe, least recently used cache with hit and miss
+# counters.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import collections
+import threading
+
+
+class LRUCache:
+    """A bounded cache that evicts the least recently used entry.
+
+    Counts hits and misses. Safe to share between threads."""
+
+    def __init__(self, maxsize=1024):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the value of key, or default if it isn't cached."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores value under key, evicting old entries if needed."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def get_or_compute(self, key, compute):
+        """Returns the value of key, calling compute() to get it if needed.
+
+        compute is called without holding the lock, so two threads missing
+        the same key at once may both compute it."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def resize(self, maxsize):
+        """Changes the number of entries kept."""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns the counters and size as a dict."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
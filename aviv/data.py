@@ -0,0 +1,863 @@
+#!/usr/bin/env python3
+"""Moon data handling for aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Fetches, stores and lazily loads the moon data that aviv-calendar
+# bases its calculations on.
+
+# CURRENT STATUS:
+# Nothing in here touches the disk or the network when imported. The
+# data is loaded on first use, or when `preload` is called.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import ast
+import base64
+import bisect
+import collections
+import datetime
+import http.client
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from aviv import astro
+from aviv import hist_data
+from aviv.month_index import MonthIndex
+from aviv.moontable import MAGIC, MoonTable, moon_value, write_moon_table
+
+LATEST_DATA_URL = 'https://www.avivcalendar.com/latest-data'
+
+# Working with a DB_FILE since we will be joining dictionaries from both git
+# synced sources, as well as the latest data that is retrieved from
+# online. The DB_FILE is a moon table, see aviv.moontable.
+DB_FILE = os.path.join(sys.path[0], 'current_data.avmt')
+# Where get_latest_data saves what it downloads. It is parsed, never
+# imported, so it must not end in .py.
+LATEST_DATA_FILE = os.path.join(sys.path[0], 'latest_data.dat')
+
+# The number of days a month may last, from one start to the next.
+MONTH_LENGTHS = (28, 29, 30)
+
+# The redirects followed by LatestDataFetcher, and at most how many in a row.
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class LatestDataError(Exception):
+    """Raised when the latest data can't be fetched from avivcalendar.com,
+    or what was fetched is not valid."""
+
+
+def _validators_file(latest_file):
+    return latest_file + '.validators'
+
+
+def _source_file(db_file):
+    # Which latest data the DB was built from, see _latest_data_stamp.
+    return db_file + '.source'
+
+
+def _latest_data_stamp():
+    """Returns the size and modification time of LATEST_DATA_FILE, or None
+    if there is none."""
+    try:
+        stat = os.stat(LATEST_DATA_FILE)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _db_is_current():
+    """Tests if the DB has been built from the latest data saved."""
+    try:
+        with open(_source_file(DB_FILE)) as in_file:
+            source = json.load(in_file)
+    except (OSError, ValueError):
+        return False
+    return source == _latest_data_stamp()
+
+
+class LatestDataFetcher:
+    """Fetches the latest data from avivcalendar.com.
+
+    The connection is kept open between fetches. The ETag and
+    Last-Modified of the last download are saved next to the downloaded
+    file, and sent along the next time, so that the file is only
+    downloaded again if it has changed. Like urlopen, it follows redirects
+    and goes through the proxies set in http_proxy, https_proxy and
+    no_proxy."""
+
+    def __init__(self, timeout=30):
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_key = None
+        self.timeout = timeout
+        # Counters of requests made and of those answered 304 Not Modified.
+        self.requests = 0
+        self.not_modified = 0
+
+    def fetch(self, url, latest_file):
+        """Saves the data at url to latest_file, unless it hasn't changed.
+
+        Returns True if new data was saved, False if not."""
+        headers = {}
+        validators = {}
+        if os.path.exists(latest_file):
+            validators = self._read_validators(latest_file)
+        if validators.get('etag') is not None:
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified') is not None:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        with self._lock:
+            for _ in range(MAX_REDIRECTS + 1):
+                status, response_headers, body = self._request(url, headers)
+                self.requests += 1
+                location = response_headers.get('Location')
+                if status not in REDIRECT_STATUSES or location is None:
+                    break
+                url = urllib.parse.urljoin(url, location)
+            else:
+                raise LatestDataError('Too many redirects from {}'.format(
+                    url))
+            if status == 304:
+                self.not_modified += 1
+                return False
+        if status != 200:
+            raise LatestDataError('Unexpected response {} from {}'.format(
+                status, url))
+
+        tmp_fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(latest_file)), suffix='.tmp')
+        with open(tmp_fd, 'wb') as out_file:
+            out_file.write(body)
+        os.replace(tmp_path, latest_file)
+        with open(_validators_file(latest_file), 'w') as out_file:
+            json.dump(
+                {
+                    'etag': response_headers.get('ETag'),
+                    'last_modified': response_headers.get('Last-Modified')
+                }, out_file)
+        return True
+
+    def close(self):
+        """Closes the connection, if open."""
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+        self._connection_key = None
+
+    def _read_validators(self, latest_file):
+        try:
+            with open(_validators_file(latest_file)) as in_file:
+                return json.load(in_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _get_proxy(self, parts):
+        proxy = urllib.request.getproxies().get(parts.scheme)
+        if proxy is None or urllib.request.proxy_bypass(parts.hostname):
+            return None
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        return urllib.parse.urlsplit(proxy)
+
+    def _get_connection(self, parts, proxy):
+        key = (parts.scheme, parts.hostname, parts.port, proxy)
+        if self._connection_key != key:
+            self.close()
+            if parts.scheme == 'https':
+                connection_class = http.client.HTTPSConnection
+            else:
+                connection_class = http.client.HTTPConnection
+            if proxy is None:
+                self._connection = connection_class(parts.hostname,
+                                                    parts.port,
+                                                    timeout=self.timeout)
+            else:
+                self._connection = connection_class(proxy.hostname,
+                                                    proxy.port or 80,
+                                                    timeout=self.timeout)
+                if parts.scheme == 'https':
+                    # HTTPS goes through a tunnel opened with CONNECT.
+                    self._connection.set_tunnel(
+                        parts.hostname, parts.port,
+                        self._proxy_headers(proxy))
+            self._connection_key = key
+        return self._connection
+
+    def _proxy_headers(self, proxy):
+        if proxy.username is None:
+            return {}
+        credentials = '{}:{}'.format(
+            urllib.parse.unquote(proxy.username),
+            urllib.parse.unquote(proxy.password or ''))
+        return {
+            'Proxy-Authorization':
+            'Basic ' + base64.b64encode(credentials.encode()).decode('ascii')
+        }
+
+    def _request(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        proxy = self._get_proxy(parts)
+        if proxy is not None and parts.scheme == 'http':
+            # A proxy is asked for the whole URL.
+            path = urllib.parse.urlunsplit(parts[:4] + ('', ))
+            headers = dict(headers, **self._proxy_headers(proxy))
+        else:
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+        # A connection kept open may have been closed by the server in the
+        # meantime, so a failed request is tried once more on a new one.
+        for attempt in (1, 2):
+            connection = self._get_connection(parts, proxy)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.headers, response.read()
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if attempt == 2:
+                    raise
+
+
+# The fetcher used by get_latest_data.
+FETCHER = LatestDataFetcher()
+
+
+def get_latest_data():
+    """Fetches the latest data available from avivcalendar.com.
+
+    Returns True if it had changed since it was last fetched."""
+    # Download the file from `https://www.avivcalendar.com/latest_data`
+    # and save it locally under LATEST_DATA_FILE. This is updated as soon
+    # as news of the new moon or the Aviv barley breaks.
+    url = LATEST_DATA_URL
+    try:
+        return FETCHER.fetch(url, LATEST_DATA_FILE)
+    except (OSError, http.client.HTTPException):
+        raise LatestDataError(
+            'Unable to connect to {}\nPlease check your internet connection.'.
+            format(url))
+
+
+# The latest data, as parsed by parse_latest_data. last_moon and next_moon
+# are dicts like MOONS, aviv_barley is the status of the barley.
+LatestData = collections.namedtuple('LatestData',
+                                    ('last_moon', 'next_moon', 'aviv_barley'))
+
+_LATEST_DATA_NAMES = ('LAST_MOON', 'NEXT_MOON', 'AVIV_BARLEY')
+
+
+def _check_moons(name, moons):
+    """Returns moons as a dict like MOONS, or raises LatestDataError."""
+    if not isinstance(moons, dict):
+        raise LatestDataError('{} is not a dict.'.format(name))
+    checked = {}
+    for key, value in moons.items():
+        try:
+            key = int(key)
+            value = tuple(value)
+            b_year, b_month, g_year, g_month, g_day, is_known = value
+            valid = (all(type(v) is int for v in value[:5])
+                     and isinstance(is_known, bool) and 1 <= b_month <= 13
+                     and key == b_year * 100 + b_month)
+            datetime.date(g_year, g_month, g_day)
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise LatestDataError('Invalid month in {}: {!r}: {!r}'.format(
+                name, key, value))
+        checked[key] = value
+    return checked
+
+
+def _follows(key, next_key):
+    """Tests if the month next_key comes right after the month key."""
+    b_year, b_month = divmod(key, 100)
+    return next_key == key + 1 or (b_month >= 12 and
+                                   next_key == (b_year + 1) * 100 + 1)
+
+
+def validate_moons(moons):
+    """Raises LatestDataError unless every month in moons (a dict like MOONS)
+    lasts as many days as in MONTH_LENGTHS.
+
+    Only months that follow each other are compared, so gaps are allowed."""
+    keys = sorted(moons)
+    for key, next_key in zip(keys, keys[1:]):
+        if not _follows(key, next_key):
+            continue
+        length = (datetime.date(*moons[next_key][2:5]) -
+                  datetime.date(*moons[key][2:5])).days
+        if length not in MONTH_LENGTHS:
+            raise LatestDataError('Month {} lasts {} days.'.format(
+                key, length))
+
+
+def _parse_assignments(text):
+    """Parses the NAME = literal lines served by avivcalendar.com, without
+    running them."""
+    try:
+        tree = ast.parse(text)
+    except SyntaxError as err:
+        raise LatestDataError('Unable to parse the latest data: {}'.format(
+            err))
+    values = {}
+    for node in tree.body:
+        if (not isinstance(node, ast.Assign) or len(node.targets) != 1
+                or not isinstance(node.targets[0], ast.Name)
+                or node.targets[0].id not in _LATEST_DATA_NAMES):
+            raise LatestDataError(
+                'Unexpected statement in the latest data, line {}.'.format(
+                    node.lineno))
+        try:
+            values[node.targets[0].id] = ast.literal_eval(node.value)
+        except ValueError:
+            raise LatestDataError(
+                '{} in the latest data is not a literal.'.format(
+                    node.targets[0].id))
+    return values
+
+
+def parse_latest_data(content):
+    """Parses the latest data into a LatestData.
+
+    content is the bytes saved by get_latest_data: either a moon table (see
+    aviv.moontable), JSON with LAST_MOON, NEXT_MOON and AVIV_BARLEY, or the
+    same as plain assignments of literals. Nothing in it is ever run.
+    Raises LatestDataError if it is not valid."""
+    if content.startswith(MAGIC):
+        # A whole table of months; they all win over hist_data.
+        try:
+            table = MoonTable.from_bytes(content)
+        except Exception as err:
+            raise LatestDataError(str(err))
+        validate_moons(table.to_moons())
+        return LatestData({}, table.to_moons(), table.aviv_barley)
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        raise LatestDataError('The latest data is not text.')
+    if text.lstrip().startswith('{'):
+        try:
+            values = json.loads(text)
+        except ValueError as err:
+            raise LatestDataError('Unable to parse the latest data: {}'.format(
+                err))
+        if not isinstance(values, dict):
+            raise LatestDataError('The latest data is not an object.')
+    else:
+        values = _parse_assignments(text)
+    missing = [name for name in _LATEST_DATA_NAMES if name not in values]
+    if missing:
+        raise LatestDataError('Missing from the latest data: {}'.format(
+            ', '.join(missing)))
+    aviv_barley = values['AVIV_BARLEY']
+    if aviv_barley is not None and not isinstance(aviv_barley, bool):
+        raise LatestDataError('AVIV_BARLEY is neither a bool nor None.')
+    last_moon = _check_moons('LAST_MOON', values['LAST_MOON'])
+    next_moon = _check_moons('NEXT_MOON', values['NEXT_MOON'])
+    moons = dict(last_moon)
+    moons.update(next_moon)
+    validate_moons(moons)
+    return LatestData(last_moon, next_moon, aviv_barley)
+
+
+class LatestDataCache:
+    """The parsed latest data, kept in memory.
+
+    The file is only parsed again once it has been replaced, and version is
+    bumped every time it is."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stat = None
+        self._latest_data = None
+        self.version = 0
+
+    def get(self, path):
+        """Returns the LatestData in path, or None if there is none."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stat = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if stat != self._stat:
+                with open(path, 'rb') as in_file:
+                    self._latest_data = parse_latest_data(in_file.read())
+                self._stat = stat
+                self.version += 1
+            return self._latest_data
+
+    def clear(self):
+        """Forgets the parsed data."""
+        with self._lock:
+            self._stat = None
+            self._latest_data = None
+
+
+# The cache used by read_latest_data.
+LATEST_DATA = LatestDataCache()
+
+
+def read_latest_data():
+    """Returns the LatestData saved by get_latest_data, or None if there is
+    none. Raises LatestDataError if it is not valid."""
+    return LATEST_DATA.get(LATEST_DATA_FILE)
+
+
+def db_mod_time():
+    """Returns the time the DB was last modified, or None if there is none."""
+    if os.path.exists(DB_FILE):
+        return datetime.datetime.fromtimestamp(os.path.getmtime(DB_FILE))
+    return None
+
+
+def db_exists():
+    """Tests if the DB has been created on this system."""
+    return db_mod_time() is not None
+
+
+def merge_moons(last_moon, next_moon):
+    """Merges hist_data.MOONS with the LAST_MOON and NEXT_MOON of latest_data.
+
+    Months found in hist_data win over LAST_MOON, while NEXT_MOON wins over
+    both."""
+    moons = dict(last_moon)
+    moons.update(hist_data.MOONS)
+    moons.update(next_moon)
+    return moons
+
+
+# Held while the DB is rebuilt, so that the refresher and a call to
+# refresh_data never fetch or write the files at the same time.
+_COMBINE_LOCK = threading.Lock()
+
+
+# Combine the data from hist_data (which is distributed with the source code),
+# and data from latest_data, which is synced in get_latest_data above.
+def combine_data():
+    """Combine data from source code with data fetched online and create DB.
+
+    Returns True if the DB was rebuilt, or False if the data hadn't changed
+    and the DB was left as it was. Only one thread at a time rebuilds the
+    DB; the others wait for it."""
+    with _COMBINE_LOCK:
+        return _combine_data()
+
+
+def _combine_data():
+    # A rebuild that failed, or was killed, after the latest data was saved
+    # leaves a DB that is not current, so it is rebuilt even if the data
+    # hasn't changed since.
+    if not get_latest_data() and db_exists() and _db_is_current():
+        # Mark the DB as checked, so that it isn't considered old.
+        os.utime(DB_FILE)
+        return False
+    try:
+        latest_data = read_latest_data()
+        if latest_data is None:
+            raise LatestDataError('No latest data in {}'.format(
+                LATEST_DATA_FILE))
+        # Combine hist_data and latest_data and stash it in the database.
+        moons = merge_moons(latest_data.last_moon, latest_data.next_moon)
+        validate_moons(moons)
+    except LatestDataError:
+        # Make sure that the next fetch downloads it again.
+        if os.path.exists(_validators_file(LATEST_DATA_FILE)):
+            os.remove(_validators_file(LATEST_DATA_FILE))
+        raise
+    stamp = _latest_data_stamp()
+    write_moon_table(DB_FILE, moons, latest_data.aviv_barley)
+    source_file = _source_file(DB_FILE)
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(source_file)), suffix='.tmp')
+    with open(tmp_fd, 'w') as out_file:
+        json.dump(stamp, out_file)
+    os.replace(tmp_path, source_file)
+
+    # Swap the new data in for anyone already using the old.
+    MOON_DATA.reload()
+    return True
+
+
+def refresh_data():
+    """Runs `combine_data`, but keeps the current data if offline or if
+    the latest data is not valid.
+
+    Returns True if the DB is up to date, False if it couldn't be
+    updated."""
+    try:
+        combine_data()
+    except LatestDataError as err:
+        logging.warning('%s\nUsing the data already available.', err)
+        return False
+    return True
+
+
+def _find_last_moon(month_index, now=None):
+    """Finds the last moon that has started by now (a POSIX timestamp,
+    by default the current time), as a dict like LAST_MOON."""
+    if now is None:
+        now = time.time()
+    # A month starts at sunset in Jerusalem, which may be tomorrow here.
+    tomorrow = datetime.date.fromtimestamp(now).toordinal() + 1
+    position = max(bisect.bisect_right(month_index.ordinals, tomorrow) - 1, 0)
+    while position > 0 and month_index.start_time(position) > now:
+        position -= 1
+    key = month_index.keys[position]
+    return {
+        key:
+        moon_value(key, month_index.ordinals[position],
+                   month_index.is_known[position])
+    }
+
+
+def _latest_last_moon():
+    """Returns the LAST_MOON of the latest data, or None if there is none."""
+    try:
+        latest_data = read_latest_data()
+    except LatestDataError as err:
+        logging.warning('%s', err)
+        return None
+    if latest_data is not None and latest_data.last_moon:
+        return latest_data.last_moon
+    return None
+
+
+def _moons_from_index(month_index):
+    """Returns the months of month_index as a dict like MOONS."""
+    return {
+        key: moon_value(key, ordinal, is_known)
+        for key, ordinal, is_known in zip(
+            month_index.keys, month_index.ordinals, month_index.is_known)
+    }
+
+
+class DataSnapshot:
+    """One version of the moon data, never changed once created.
+
+    Take one with `MOON_DATA.snapshot()` and read everything needed from it,
+    so that a refresh in the meantime can't mix two versions of the data.
+    month_index is a `MonthIndex` of the moons, aviv_barley the status of
+    the barley (None if unknown) and version the number of the snapshot.
+    See `last_moon` for the last moon sighted."""
+
+    __slots__ = ('month_index', 'aviv_barley', 'version', '_last_moon',
+                 '_table', '_moons')
+
+    def __init__(self, month_index, aviv_barley, last_moon, version,
+                 table=None, moons=None):
+        set_slot = object.__setattr__
+        set_slot(self, 'month_index', month_index)
+        set_slot(self, 'aviv_barley', aviv_barley)
+        # The LAST_MOON of the latest data, if any.
+        set_slot(self, '_last_moon', last_moon)
+        set_slot(self, 'version', version)
+        # The moon table month_index reads from, kept open as long as the
+        # snapshot is in use.
+        set_slot(self, '_table', table)
+        set_slot(self, '_moons', moons)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('DataSnapshot is immutable')
+
+    @property
+    def moons(self):
+        """The combined MOONS of hist_data and latest_data, as a dict.
+
+        Unless loaded from hist_data, the dict is only built if asked for,
+        and must not be modified."""
+        moons = self._moons
+        if moons is None:
+            # Two threads may both build it, but they build the same.
+            moons = _moons_from_index(self.month_index)
+            object.__setattr__(self, '_moons', moons)
+        return moons
+
+    @property
+    def last_moon(self):
+        """The last moon sighted, as a dict with a single key.
+
+        That is the LAST_MOON of the latest data, unless a later month has
+        started since according to the month index. Worked out when asked
+        for, so it stays right however long the snapshot is in use."""
+        last_moon = _find_last_moon(self.month_index)
+        if self._last_moon is not None and min(self._last_moon) >= min(
+                last_moon):
+            return self._last_moon
+        return last_moon
+
+
+class MoonData:
+    """The moon data, loaded on first use.
+
+    Use the `MOON_DATA` instance rather than creating new ones. If there is
+    no DB, the historical data from hist_data is used right away, while
+    `REFRESHER` creates one in the background.
+
+    The DB is a moon table (see aviv.moontable), memory mapped so that the
+    month index reads straight from the file.
+
+    The data is held in a `DataSnapshot`, which is replaced as a whole when
+    new data is loaded. Reading it takes no lock."""
+
+    def __init__(self):
+        # Only taken to load, never to read.
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._version = 0
+
+    @property
+    def loaded(self):
+        """True if the data has been loaded."""
+        return self._snapshot is not None
+
+    @property
+    def version(self):
+        """The version of the data, bumped every time new data is loaded."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self._version
+        return snapshot.version
+
+    def snapshot(self):
+        """Returns the current DataSnapshot, loading the data if needed."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.load()._snapshot
+        return snapshot
+
+    @property
+    def moons(self):
+        """The moons of the current snapshot, see `DataSnapshot.moons`."""
+        return self.snapshot().moons
+
+    @property
+    def aviv_barley(self):
+        """The status of the barley, or None if unknown."""
+        return self.snapshot().aviv_barley
+
+    @property
+    def last_moon(self):
+        """The last moon sighted, as a dict with a single key."""
+        return self.snapshot().last_moon
+
+    @property
+    def month_index(self):
+        """A `MonthIndex` of the moons, built once per version of the data."""
+        return self.snapshot().month_index
+
+    def load(self):
+        """Loads the data unless it has already been loaded."""
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._load()
+        return self
+
+    def clear(self):
+        """Forgets the loaded data, so that it is read again on next use."""
+        with self._lock:
+            self._snapshot = None
+
+    def reload(self):
+        """Reads the DB again and swaps the new data in.
+
+        Unlike `clear`, readers keep getting the old data until the new
+        data is ready. Does nothing if the data hasn't been loaded yet."""
+        if self._snapshot is None:
+            return
+        table = MoonTable(DB_FILE)
+        month_index = table.month_index()
+        last_moon = _latest_last_moon()
+        with self._lock:
+            self._swap(month_index, table.aviv_barley, last_moon, table)
+
+    def install(self, month_index, aviv_barley=None, last_moon=None):
+        """Swaps in data that has already been read elsewhere, like in
+        another process, instead of reading the DB."""
+        with self._lock:
+            self._swap(month_index, aviv_barley, last_moon)
+
+    def _load(self):
+        if not db_exists():
+            # Never wait for the network here; the new DB is swapped in
+            # once the refresher has created it.
+            logging.debug('DB_FILE does not exist on this system. Using the '
+                          'historical data until it has been created.')
+            moons = dict(hist_data.MOONS)
+            month_index = MonthIndex(moons)
+            self._swap(month_index, None, _latest_last_moon(), moons=moons)
+            REFRESHER.maybe_refresh(check_moon=False)
+            return
+
+        table = MoonTable(DB_FILE)
+        month_index = table.month_index()
+        self._swap(month_index, table.aviv_barley, _latest_last_moon(),
+                   table)
+
+    def _swap(self, month_index, aviv_barley, last_moon, table=None,
+              moons=None):
+        # Called with the lock held, so versions are never reused. Readers
+        # see either the old snapshot or the new one, never a mix.
+        self._version += 1
+        self._snapshot = DataSnapshot(month_index, aviv_barley, last_moon,
+                                      self._version, table, moons)
+
+
+MOON_DATA = MoonData()
+
+
+class DataRefresher:
+    """Refreshes the DB in the background, at most once per interval.
+
+    `maybe_refresh` is cheap and never blocks: it only decides whether a
+    refresh is due, and if so starts one on a daemon thread. A refresh is
+    due if there is no DB, if the DB is older than max_age, or if the moon
+    has recently renewed. Once done, the new data is swapped in by
+    `MoonData.reload`.
+
+    last_refresh, last_duration and last_success describe the last refresh
+    that finished. See `stats`."""
+
+    def __init__(self, interval=datetime.timedelta(hours=1),
+                 max_age=datetime.timedelta(days=1)):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_check = None
+        self.interval = interval
+        self.max_age = max_age
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh = None
+        self.last_duration = None
+        self.last_success = None
+
+    @property
+    def running(self):
+        """True while a refresh is running."""
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def is_due(self, check_moon=True):
+        """Returns True if the DB should be refreshed.
+
+        Unless check_moon is False, the phase of the moon is checked as
+        well."""
+        mod_time = db_mod_time()
+        if mod_time is None:
+            return True
+        if datetime.datetime.now() - mod_time > self.max_age:
+            return True
+        if check_moon:
+            m_phase = astro.moon_phase(datetime.date.today())
+            logging.debug('current m_phase at time of test is %s', m_phase)
+            if m_phase <= 2:
+                return True
+        return False
+
+    def maybe_refresh(self, check_moon=True):
+        """Starts a refresh in the background if one is due.
+
+        Returns True if a refresh was started."""
+        now = time.monotonic()
+        interval = self.interval.total_seconds()
+        last_check = self._last_check
+        if last_check is not None and now - last_check < interval:
+            return False
+        with self._lock:
+            last_check = self._last_check
+            if last_check is not None and now - last_check < interval:
+                return False
+            if self.running:
+                return False
+            self._last_check = now
+            if not self.is_due(check_moon):
+                return False
+            self._thread = threading.Thread(target=self.refresh,
+                                            name='aviv-data-refresh',
+                                            daemon=True)
+            self._thread.start()
+        return True
+
+    def refresh(self):
+        """Refreshes the DB right away, in the calling thread.
+
+        Returns True if the DB is up to date."""
+        start = time.perf_counter()
+        try:
+            success = refresh_data()
+        except Exception:
+            logging.exception('Refreshing the data failed.')
+            success = False
+        self.last_duration = time.perf_counter() - start
+        self.last_refresh = datetime.datetime.now()
+        self.last_success = success
+        self.refreshes += 1
+        if not success:
+            self.failures += 1
+        return success
+
+    def wait(self, timeout=None):
+        """Waits for a running refresh to finish. Returns True if none is
+        running afterwards."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return not self.running
+
+    def stats(self):
+        """Returns the metrics of the refresher as a dict."""
+        return {
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'running': self.running,
+            'last_refresh': self.last_refresh,
+            'last_duration': self.last_duration,
+            'last_success': self.last_success
+        }
+
+
+# The refresher used by aviv-calendar, shared by the whole process.
+REFRESHER = DataRefresher()
+
+
+def preload(wait=False, timeout=None):
+    """Loads the moon data right away instead of on first use.
+
+    Useful for paying the start up cost before serving any requests. Like
+    on first use, if there is no DB yet this doesn't wait for one to be
+    fetched, and the historical data is used until then. With wait=True it
+    waits up to timeout seconds for the DB to be created instead, which is
+    needed to convert dates after the end of the historical data."""
+    MOON_DATA.load()
+    if wait and not db_exists():
+        REFRESHER.wait(timeout)
+    return MOON_DATA
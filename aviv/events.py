@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Finding the next sabbath, feast or month in aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Answers questions like "when is the next sabbath in Stockholm?" or
+# "when is the next Yom Kippur?" straight from the month index and the
+# year calendars, without converting one day after another.
+# Example:
+#   next_feast('Yom Kippur', datetime.datetime(2018, 1, 1), 'Jerusalem')
+
+# CURRENT STATUS:
+# Every event is returned with the sunset it starts and ends at, in the
+# time zone of the location.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import bisect
+import collections
+import datetime
+from aviv import Aviv
+from aviv import astro
+from aviv import data
+from aviv.month_index import MAX_MONTH_LENGTH
+
+# An event, as returned by the functions below. b_date is the biblical
+# date as (year, month, day), start the sunset it starts at and end the
+# sunset it ends at.
+Event = collections.namedtuple('Event', ('name', 'b_date', 'start', 'end'))
+
+# Friday, the day the weekly sabbath starts at sunset.
+_FRIDAY = 4
+
+
+def _sunset(location, ordinal):
+    return astro.sun_events(location, datetime.date.fromordinal(ordinal))[1]
+
+
+def _prepare(location, after, geocoder):
+    location = Aviv.resolve_location(location, geocoder)
+    if after is None:
+        after = datetime.datetime.now(location.tz)
+    return location, Aviv._localize(after, location)
+
+
+def _b_date(month_index, ordinal):
+    """Returns the biblical date that has daylight on the date ordinal, or
+    None if it is not in the data."""
+    position = bisect.bisect_left(month_index.ordinals, ordinal) - 1
+    if position < 0 or (ordinal - month_index.ordinals[position] >
+                        MAX_MONTH_LENGTH):
+        return None
+    b_year, b_month = divmod(month_index.keys[position], 100)
+    return (b_year, b_month, ordinal - month_index.ordinals[position])
+
+
+def _event(name, b_date, location, eve):
+    return Event(name, b_date, _sunset(location, eve),
+                 _sunset(location, eve + 1))
+
+
+def next_month_start(after=None, location='Jerusalem', geocoder='astral'):
+    """Returns the Event of the first month to start after after.
+
+    after is a datetime, taken as local time at location if naive, and
+    defaults to now. Returns None if there is no such month in the data."""
+    location, after = _prepare(location, after, geocoder)
+    month_index = data.MOON_DATA.snapshot().month_index
+    ordinal = after.toordinal()
+    position = bisect.bisect_left(month_index.ordinals, ordinal)
+    while position < len(month_index):
+        eve = month_index.ordinals[position]
+        start = _sunset(location, eve)
+        if start > after:
+            b_year, b_month = divmod(month_index.keys[position], 100)
+            return Event('{} month'.format(Aviv.COUNT[b_month - 1]),
+                         (b_year, b_month, 1), start,
+                         _sunset(location, eve + 1))
+        position += 1
+    return None
+
+
+def _next_feast_day(snapshot, location, after, match):
+    """Returns the Event of the first feast day in snapshot starting after
+    after for which match(feast_day) is True. See YearCalendar.feast_days."""
+    month_index = snapshot.month_index
+    ordinal = after.toordinal()
+    position = max(bisect.bisect_right(month_index.ordinals, ordinal) - 1, 0)
+    # The eve of the feast may be before the start of its year.
+    first_year = month_index.keys[position] // 100 - 1
+    last_year = month_index.keys[-1] // 100
+    for b_year in range(first_year, last_year + 1):
+        feast_days = Aviv.year_calendar(b_year, snapshot).feast_days
+        for feast_day in feast_days[bisect.bisect_left(feast_days,
+                                                       (ordinal, )):]:
+            if not match(feast_day):
+                continue
+            eve, b_month, b_day = feast_day[:3]
+            event = _event(feast_day[5], (b_year, b_month, b_day), location,
+                           eve)
+            if event.start > after:
+                return event
+    return None
+
+
+def next_feast(name=None, after=None, location='Jerusalem',
+               geocoder='astral'):
+    """Returns the Event of the next feast day called name.
+
+    name is matched against the names of the feast days, ignoring case, so
+    'yom kippur' is enough. With no name, the next feast day of any kind is
+    returned. after is a datetime, taken as local time at location if naive,
+    and defaults to now. Returns None if there is no such day in the
+    data."""
+    location, after = _prepare(location, after, geocoder)
+    snapshot = data.MOON_DATA.snapshot()
+    if name is None:
+        return _next_feast_day(snapshot, location, after,
+                               lambda feast_day: True)
+    name = name.casefold()
+    return _next_feast_day(
+        snapshot, location, after,
+        lambda feast_day: name in feast_day[5].casefold())
+
+
+def next_sabbath(location='Jerusalem',
+                 after=None,
+                 weekly_only=False,
+                 geocoder='astral'):
+    """Returns the Event of the next sabbath to start after after.
+
+    Like `sabbath` of BibTime, both weekly sabbaths and high feast sabbaths
+    count, unless weekly_only is True. after is a datetime, taken as local
+    time at location if naive, and defaults to now. Returns None if there
+    is no such day in the data."""
+    location, after = _prepare(location, after, geocoder)
+    # The weekly sabbath and the feasts are looked up in the same data,
+    # even if a refresh swaps in new data in the meantime.
+    snapshot = data.MOON_DATA.snapshot()
+    ordinal = after.toordinal()
+    eve = ordinal + (_FRIDAY - after.weekday()) % 7
+    if _sunset(location, eve) <= after:
+        eve += 7
+    b_date = _b_date(snapshot.month_index, eve + 1)
+    if b_date is None:
+        return None
+    event = _event('Sabbath', b_date, location, eve)
+    if weekly_only is True:
+        return event
+    feast = _next_feast_day(snapshot, location, after,
+                            lambda feast_day: feast_day[4] is True)
+    if feast is not None and feast.start < event.start:
+        return feast
+    return event
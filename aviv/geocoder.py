@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Offline geocoding for aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Looks up cities in the table of locations that comes with astral,
+# without ever touching the network.
+
+# CURRENT STATUS:
+# The table is parsed once per process. Lookups are a dict access.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import bisect
+import copy
+import threading
+import astral
+
+
+def normalize(name):
+    """Normalizes a city name for lookups: 'new  York' -> 'new york'."""
+    return ' '.join(str(name).replace('_', ' ').split()).casefold()
+
+
+class OfflineGeocoder:
+    """Looks up cities in the table of locations bundled with astral.
+
+    Meant to be handed to astral, like `Astral(geocoder=OfflineGeocoder)`.
+    Lookups are case insensitive and accept an optional region, as in
+    'Stockholm, Sweden'. Where several cities share a name, the same one
+    as astral's own geocoder is returned.
+
+    The table is parsed into a dict the first time it's needed, and shared
+    by all instances. Unknown cities raise KeyError right away."""
+
+    _lock = threading.Lock()
+    # normalized name -> Location, and (name, region) -> Location.
+    _index = None
+    # Sorted normalized names, for prefix searches. Built on first use.
+    _names = None
+
+    def __init__(self):
+        self._load()
+
+    @classmethod
+    def _load(cls):
+        if cls._index is not None:
+            return
+        with cls._lock:
+            if cls._index is not None:
+                return
+            index = {}
+            # astral looks through the time zone groups in the order they
+            # were first seen, so the first city of a name in the first
+            # group wins.
+            group_order = {}
+            candidates = {}
+            for line in astral._LOCATION_INFO.split('\n'):
+                line = line.strip()
+                if line == '' or line[0] == '#':
+                    continue
+                location = astral.Location(line.split(','))
+                group = group_order.setdefault(location._timezone_group,
+                                               len(group_order))
+                name = normalize(location.name)
+                region = normalize(location.region)
+                index.setdefault((name, region), location)
+                if name not in candidates or group < candidates[name][0]:
+                    candidates[name] = (group, location)
+            for name, candidate in candidates.items():
+                index[name] = candidate[1]
+            cls._index = index
+
+    def __getitem__(self, key):
+        """Returns a copy of the Location of key."""
+        name, _, region = str(key).partition(',')
+        lookup = normalize(name)
+        if region.strip() != '':
+            lookup = (lookup, normalize(region))
+        try:
+            return copy.copy(self._index[lookup])
+        except KeyError:
+            raise KeyError('Unrecognised location name - {}'.format(key))
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def lookup(self, key, fuzzy=False):
+        """Like `geocoder[key]`, but with fuzzy set to True a name that is
+        the beginning of exactly one city name is accepted as well."""
+        try:
+            return self[key]
+        except KeyError:
+            if fuzzy is not True:
+                raise
+        matches = self.complete(key)
+        if len(matches) != 1:
+            raise KeyError('Unrecognised location name - {}'.format(key))
+        return self[matches[0]]
+
+    def complete(self, prefix, limit=None):
+        """Returns the city names starting with prefix, in sorted order."""
+        names = self._prefix_names()
+        prefix = normalize(prefix)
+        matches = []
+        for name in names[bisect.bisect_left(names, prefix):]:
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
+
+    @classmethod
+    def _prefix_names(cls):
+        if cls._names is None:
+            cls._names = sorted(key for key in cls._index
+                                if not isinstance(key, tuple))
+        return cls._names
+
+
+class LocationPool:
+    """Locations that have already been looked up, by city name and geocoder.
+
+    Safe to share between threads. A city is only looked up once, even if
+    many threads ask for it at the same time. Only the threads asking for
+    the same city wait for its lookup."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locations = {}
+        # key: the lock held while that city is being looked up.
+        self._key_locks = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    def get(self, city_name, geocoder, find):
+        """Returns the location of city_name, calling find(city_name) to look
+        it up the first time. geocoder is the name of the geocoder used."""
+        key = (normalize(city_name), geocoder)
+        try:
+            return self._locations[key]
+        except KeyError:
+            pass
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                return self._locations[key]
+            except KeyError:
+                pass
+            try:
+                location = find(city_name)
+                with self._lock:
+                    self._locations[key] = location
+                return location
+            finally:
+                # Also when the city isn't found, so that looking up names
+                # that don't exist doesn't leave locks behind.
+                with self._lock:
+                    if self._key_locks.get(key) is key_lock:
+                        del self._key_locks[key]
+
+    def clear(self):
+        """Forgets all locations."""
+        with self._lock:
+            self._locations.clear()
+            self._key_locks.clear()
+
+
+# The locations looked up by aviv-calendar, shared by the whole process.
+LOCATION_POOL = LocationPool()
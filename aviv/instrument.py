@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Timing of the stages of a conversion in aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tells where the time of a BibTime went: geocoding, checking the DB,
+# the sun, the moon phase, finding the month or the feasts.
+# Example:
+#   aggregator = StageAggregator()
+#   with recording(aggregator):
+#       BibTime('Jerusalem')
+#   aggregator.report()
+
+# CURRENT STATUS:
+# Off unless a hook has been added. Each BibTime conversion is then
+# passed to the hooks as a Conversion, once done.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import collections
+import contextlib
+import math
+import threading
+import time
+
+# True while there are hooks. Nothing is timed otherwise.
+ENABLED = False
+
+# The stages of a conversion, in the order they are run.
+STAGES = ('geocode', 'db_check', 'sun', 'moon_phase', 'find_month',
+          'feasts')
+
+_hooks = []
+_hooks_lock = threading.Lock()
+_local = threading.local()
+
+# name: LRUCache, the caches whose hits and misses are counted.
+_caches = {}
+
+
+def register_cache(name, cache):
+    """Counts the hits and misses of cache (an LRUCache) in each
+    conversion, under name."""
+    _caches[name] = cache
+
+
+def clear_caches():
+    """Empties every cache registered with `register_cache`."""
+    for cache in list(_caches.values()):
+        cache.clear()
+
+
+class Conversion:
+    """The timings of one conversion.
+
+    stages maps the name of each stage to the seconds spent in it, caches
+    maps the name of each cache to a dict of the hits and misses during the
+    conversion, and total is the seconds spent in all. The cache counts are
+    those of the whole process, so they include other threads."""
+
+    __slots__ = ('stages', 'caches', 'total', '_start', '_counts')
+
+    def __init__(self):
+        self.stages = {}
+        self.caches = {}
+        self.total = None
+        self._counts = {
+            name: (cache.hits, cache.misses)
+            for name, cache in _caches.items()
+        }
+        self._start = time.perf_counter()
+
+    def _finish(self):
+        self.total = time.perf_counter() - self._start
+        for name, cache in _caches.items():
+            hits, misses = self._counts[name]
+            self.caches[name] = {
+                'hits': cache.hits - hits,
+                'misses': cache.misses - misses
+            }
+
+
+class _Stage:
+    __slots__ = ('conversion', 'name', 'start')
+
+    def __init__(self, conversion, name):
+        self.conversion = conversion
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        stages = self.conversion.stages
+        stages[self.name] = stages.get(self.name, 0.0) + \
+            time.perf_counter() - self.start
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Returns a context manager timing the stage name of the conversion
+    being run. Does nothing unless instrumentation is on."""
+    if not ENABLED:
+        return _NULL_STAGE
+    conversion = getattr(_local, 'conversion', None)
+    if conversion is None:
+        return _NULL_STAGE
+    return _Stage(conversion, name)
+
+
+class _Recording:
+    __slots__ = ('conversion', )
+
+    def __enter__(self):
+        self.conversion = Conversion()
+        _local.conversion = self.conversion
+        return self.conversion
+
+    def __exit__(self, *exc_info):
+        _local.conversion = None
+        self.conversion._finish()
+        for hook in list(_hooks):
+            hook(self.conversion)
+
+
+def conversion():
+    """Returns a context manager timing a conversion, and passing it to the
+    hooks once done. Does nothing unless instrumentation is on.
+
+    Conversions inside a conversion are counted as part of it."""
+    if not ENABLED or getattr(_local, 'conversion', None) is not None:
+        return _NULL_STAGE
+    return _Recording()
+
+
+def add_hook(hook):
+    """Calls hook(conversion) after every conversion, with a Conversion."""
+    global ENABLED
+    with _hooks_lock:
+        _hooks.append(hook)
+        ENABLED = True
+
+
+def remove_hook(hook):
+    """Stops calling hook."""
+    global ENABLED
+    with _hooks_lock:
+        _hooks.remove(hook)
+        ENABLED = len(_hooks) > 0
+
+
+@contextlib.contextmanager
+def recording(hook):
+    """Calls hook after every conversion within the with block."""
+    add_hook(hook)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
+
+
+def percentile(sorted_values, fraction):
+    """Returns the value at fraction (0 to 1) of sorted_values, by the
+    nearest rank."""
+    if not sorted_values:
+        return None
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank - 1, 0), len(sorted_values) - 1)]
+
+
+class StageAggregator:
+    """A hook that keeps the latest timings of each stage and reports their
+    p50 and p99. At most maxlen timings are kept per stage."""
+
+    def __init__(self, maxlen=10000):
+        self._lock = threading.Lock()
+        self.maxlen = maxlen
+        self.timings = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.maxlen))
+        self.cache_counts = collections.defaultdict(lambda: {
+            'hits': 0,
+            'misses': 0
+        })
+
+    def __call__(self, conversion):
+        with self._lock:
+            for name, seconds in conversion.stages.items():
+                self.timings[name].append(seconds)
+            self.timings['total'].append(conversion.total)
+            for name, counts in conversion.caches.items():
+                self.cache_counts[name]['hits'] += counts['hits']
+                self.cache_counts[name]['misses'] += counts['misses']
+
+    def report(self):
+        """Returns a dict of stage: {'count', 'p50', 'p99'}, in seconds,
+        with the cache counts under 'caches'."""
+        with self._lock:
+            report = {}
+            for name, timings in self.timings.items():
+                values = sorted(timings)
+                report[name] = {
+                    'count': len(values),
+                    'p50': percentile(values, 0.5),
+                    'p99': percentile(values, 0.99)
+                }
+            report['caches'] = {
+                name: dict(counts)
+                for name, counts in self.cache_counts.items()
+            }
+            return report
+
+    def clear(self):
+        """Forgets all timings."""
+        with self._lock:
+            self.timings.clear()
+            self.cache_counts.clear()
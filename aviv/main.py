@@ -34,6 +34,10 @@ import argparse
 import re
 import Aviv
 
+# How long to wait, in seconds, for the data to be fetched on the first run,
+# and for a refresh started in the background to finish before exiting.
+REFRESH_TIMEOUT = 60
+
 
 def main():
     """Find out the biblical calendar data for a
@@ -101,12 +105,21 @@ def main():
         elif args.geocoder == 'google':
             args.location = str(args.location + ', ' + args.country)
 
+    # The historical data ends in 2019, so on the first run, wait for the
+    # latest data before converting anything.
+    Aviv.preload(wait=True, timeout=REFRESH_TIMEOUT)
+
     # Put everything together and create the main object that _info will be
     # based on.
     main_city = Aviv.BibTime(args.location, args.geocoder, args.year,
                              args.month, args.day, args.hour)
     _info(main_city)
 
+    # The data is refreshed on a daemon thread, which would be killed as
+    # soon as we return.
+    if not Aviv.data.REFRESHER.wait(REFRESH_TIMEOUT):
+        print('Gave up waiting for the latest data to be fetched.')
+
 
 def _info(loc):
     """Prints information about the given location and it's calendar data."""
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""A sorted index of the months in aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Keeps the start dates of all the months in MOONS sorted, so that the
+# month of any gregorian date can be found with a binary search.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import bisect
+import datetime
+from aviv import astro
+
+# A month is never longer than 30 days, so a date further away than that
+# from the start of the closest month is not covered by the data.
+MAX_MONTH_LENGTH = 30
+
+# Nor is it ever shorter than 28 days.
+MIN_MONTH_LENGTH = 28
+
+
+class MonthIndex:
+    """Index of months, built from a dict like MOONS.
+
+    Holds three parallel tuples, sorted by the start of the month:
+    `ordinals` (the gregorian date the month starts, as an ordinal),
+    `keys` (the key of the month in MOONS, YYYYMM) and `is_known`, as
+    well as `positions`, mapping each key to its position.
+    An index read from a moon table also has `start_times`, the sunset
+    each month starts at, see `start_time`.
+    The index is never changed after it has been built."""
+
+    def __init__(self, moons):
+        entries = sorted(
+            (datetime.date(value[2], value[3], value[4]).toordinal(), key,
+             value[5]) for key, value in moons.items())
+        self.ordinals = tuple(entry[0] for entry in entries)
+        self.keys = tuple(entry[1] for entry in entries)
+        self.is_known = tuple(entry[2] for entry in entries)
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.start_times = None
+        self._start_times = {}
+
+    @classmethod
+    def from_columns(cls, ordinals, keys, is_known, start_times=None):
+        """Builds an index from columns that are already sorted by ordinal,
+        like those of a MoonTable. The columns are used as they are, without
+        being copied."""
+        index = cls.__new__(cls)
+        index.ordinals = ordinals
+        index.keys = keys
+        index.is_known = is_known
+        index.positions = {key: i for i, key in enumerate(keys)}
+        index.start_times = start_times
+        index._start_times = {}
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, date, has_set=False):
+        """Returns the position in the index of the month containing date.
+
+        Since the dates in MOONS are the gregorian dates that the first
+        biblical day of the month STARTS, the month hasn't yet begun on
+        that date until the sun has set. Use has_set to tell."""
+        target = date.toordinal() + (1 if has_set is True else 0)
+        position = bisect.bisect_left(self.ordinals, target) - 1
+        if position < 0 or (date.toordinal() - self.ordinals[position] >
+                            MAX_MONTH_LENGTH):
+            raise Exception('No potential month found')
+        return position
+
+    def find_many(self, dates, has_set):
+        """Like `find`, but for many dates at once.
+
+        dates and has_set are sequences of the same length. The dates are
+        looked up in sorted order, so that every search can start where the
+        previous one ended. Returns a list of positions."""
+        targets = [
+            date.toordinal() + (1 if sun_has_set is True else 0)
+            for date, sun_has_set in zip(dates, has_set)
+        ]
+        positions = [None] * len(targets)
+        ordinals = self.ordinals
+        position = 0
+        for i in sorted(range(len(targets)), key=targets.__getitem__):
+            position = bisect.bisect_left(ordinals, targets[i], position)
+            found = position - 1
+            if found < 0 or (dates[i].toordinal() - ordinals[found] >
+                             MAX_MONTH_LENGTH):
+                raise Exception('No potential month found')
+            positions[i] = found
+        return positions
+
+    def find_key(self, date, has_set=False):
+        """Returns the key (YYYYMM) of the month containing date."""
+        return self.keys[self.find(date, has_set)]
+
+    def months_of_year(self, b_year):
+        """Returns a dict of month: start ordinal for the months of b_year."""
+        months = {}
+        for month in range(1, 14):
+            position = self.positions.get(b_year * 100 + month)
+            if position is not None:
+                months[month] = self.ordinals[position]
+        return months
+
+    def start_date(self, position):
+        """Returns the gregorian start date of the month at position."""
+        return datetime.date.fromordinal(self.ordinals[position])
+
+    def clear_start_times(self):
+        """Forgets the start times worked out so far. Those read from a
+        moon table are kept, as they are never worked out."""
+        self._start_times.clear()
+
+    def start_time(self, position):
+        """Returns the instant the month at position starts, at sunset in
+        Jerusalem on its start date, as a POSIX timestamp.
+
+        Taken from the start_times column if there is one, or else worked
+        out the first time it is asked for."""
+        if self.start_times is not None:
+            return self.start_times[position]
+        try:
+            return self._start_times[position]
+        except KeyError:
+            start_time = astro.month_start_timestamp(
+                self.start_date(position))
+            self._start_times[position] = start_time
+            return start_time
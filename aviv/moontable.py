@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""A compact binary file format for the moon data of aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Stores MOONS as fixed width binary columns that can be memory mapped
+# and read without unpickling or copying anything. Processes reading the
+# same file share its pages.
+
+# CURRENT STATUS:
+# Layout of version 2, all little endian:
+#   header:      magic b'AVMT', version (uint16), reserved (uint16),
+#                count (uint32), aviv barley (int8, -1 for unknown),
+#                3 bytes of padding.
+#   start times: count * int64, the sunset in Jerusalem each month starts
+#                at, as a POSIX timestamp.
+#   keys:        count * uint32, the key of each month (YYYYMM).
+#   ordinals:    count * int32, the gregorian date each month starts on,
+#                as given by datetime.date.toordinal().
+#   known:       count * uint8, 1 if the month is based on observation.
+# The months are sorted by ordinal. Version 1 is the same without the
+# start times, which are then worked out when needed.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import array
+import datetime
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from aviv import astro
+from aviv.month_index import MonthIndex
+
+MAGIC = b'AVMT'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIb3x')
+
+# Windows won't replace a file that is mapped, so there the table is read
+# into memory instead, which lets write_moon_table swap in a new one.
+USE_MMAP = os.name != 'nt'
+
+_BARLEY_TO_BYTE = {None: -1, False: 0, True: 1}
+_BYTE_TO_BARLEY = {-1: None, 0: False, 1: True}
+
+
+def moon_value(key, ordinal, is_known):
+    """Returns the MOONS tuple of a month from its key, ordinal and is_known.
+
+    Example: (6018, 1, 2018, 3, 18, True)"""
+    b_year, b_month = divmod(key, 100)
+    date = datetime.date.fromordinal(ordinal)
+    return (b_year, b_month, date.year, date.month, date.day, bool(is_known))
+
+
+def write_moon_table(path, moons, aviv_barley=None):
+    """Writes moons (a dict like MOONS) and aviv_barley to a file at path.
+
+    The file is written next to path first and then moved into place, so
+    a process reading the old file is never handed a half written one."""
+    entries = sorted((datetime.date(value[2], value[3], value[4]).toordinal(),
+                      key, value[5]) for key, value in moons.items())
+    # The months of the whole table are worked out once, so they are kept
+    # out of the sun cache.
+    start_times = array.array(
+        'q', (astro.month_start_timestamp(datetime.date.fromordinal(entry[0]),
+                                          cache=False) for entry in entries))
+    keys = array.array('I', (entry[1] for entry in entries))
+    ordinals = array.array('i', (entry[0] for entry in entries))
+    known = array.array('B', (1 if entry[2] else 0 for entry in entries))
+    if sys.byteorder != 'little':
+        start_times.byteswap()
+        keys.byteswap()
+        ordinals.byteswap()
+
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with open(tmp_fd, 'wb') as out_file:
+        out_file.write(
+            HEADER.pack(MAGIC, VERSION, 0, len(entries),
+                        _BARLEY_TO_BYTE[aviv_barley]))
+        out_file.write(start_times.tobytes())
+        out_file.write(keys.tobytes())
+        out_file.write(ordinals.tobytes())
+        out_file.write(known.tobytes())
+    os.replace(tmp_path, path)
+
+
+class MoonTable:
+    """A moon table file, memory mapped for reading (or read into memory
+    if USE_MMAP is False).
+
+    `keys`, `ordinals`, `is_known` and `start_times` are views straight
+    into the mapped file, in the same order as a MonthIndex. `start_times`
+    is None for a table of version 1. If buffer is given, the table is read
+    from it instead of the file at path."""
+
+    def __init__(self, path, buffer=None):
+        if buffer is None:
+            with open(path, 'rb') as in_file:
+                if USE_MMAP:
+                    buffer = mmap.mmap(in_file.fileno(),
+                                       0,
+                                       access=mmap.ACCESS_READ)
+                else:
+                    buffer = in_file.read()
+        self._mmap = buffer
+        if len(buffer) < HEADER.size:
+            raise Exception('{} is not a moon table.'.format(path))
+        magic, version, _, count, barley = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise Exception('{} is not a moon table.'.format(path))
+        if version not in (1, VERSION):
+            raise Exception('Unsupported moon table version: {}'.format(
+                version))
+        self.aviv_barley = _BYTE_TO_BARLEY[barley]
+        row_size = 9 if version == 1 else 17
+        if len(buffer) < HEADER.size + row_size * count:
+            raise Exception('{} is truncated.'.format(path))
+
+        offset = HEADER.size
+        self.start_times = None
+        if version >= 2:
+            self.start_times = self._column('q', offset, count)
+            offset += 8 * count
+        self.keys = self._column('I', offset, count)
+        offset += 4 * count
+        self.ordinals = self._column('i', offset, count)
+        offset += 4 * count
+        self.is_known = self._column('B', offset, count)
+
+    @classmethod
+    def from_bytes(cls, content, name='<bytes>'):
+        """Reads a moon table from content (bytes) rather than a file."""
+        return cls(name, content)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _column(self, typecode, offset, count):
+        size = struct.calcsize(typecode) * count
+        view = memoryview(self._mmap)[offset:offset + size]
+        if sys.byteorder == 'little' or size == count:
+            return view.cast(typecode)
+        # On big endian machines the column has to be copied and swapped.
+        column = array.array(typecode, view.tobytes())
+        column.byteswap()
+        return column
+
+    def month_index(self):
+        """Returns a MonthIndex reading straight from the table."""
+        return MonthIndex.from_columns(self.ordinals, self.keys,
+                                       self.is_known, self.start_times)
+
+    def to_moons(self):
+        """Returns the table as a dict like MOONS."""
+        return {
+            key: moon_value(key, ordinal, is_known)
+            for key, ordinal, is_known in zip(self.keys, self.ordinals,
+                                              self.is_known)
+        }
+
+
+if __name__ == '__main__':
+    # Converts hist_data, and latest_data if there is one, into a table.
+    # Usage: python -m aviv.moontable <path>
+    from aviv import data
+    from aviv import hist_data
+    latest_data = data.read_latest_data()
+    if latest_data is None:
+        write_moon_table(sys.argv[1], hist_data.MOONS)
+    else:
+        write_moon_table(
+            sys.argv[1],
+            data.merge_moons(latest_data.last_moon, latest_data.next_moon),
+            latest_data.aviv_barley)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Converting many locations in parallel with aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Spreads the conversion of many locations over many dates across a pool
+# of processes, one location at a time.
+# Example:
+#   for city, columns in convert_parallel(cities, dates, workers=8):
+#       ...
+
+# CURRENT STATUS:
+# The month index and the dates are handed to each worker once, when it
+# starts. Each task is then just the name of a location.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import array
+import concurrent.futures
+from aviv import Aviv
+from aviv import data
+from aviv.month_index import MonthIndex
+
+# Set in each worker by _init_worker.
+_WORKER = {}
+
+
+def _init_worker(ordinals, keys, is_known, start_times, aviv_barley,
+                 last_moon, dates, geocoder, columns):
+    month_index = MonthIndex.from_columns(ordinals, keys, is_known,
+                                          start_times)
+    data.MOON_DATA.install(month_index, aviv_barley, last_moon)
+    _WORKER['dates'] = dates
+    _WORKER['geocoder'] = geocoder
+    _WORKER['columns'] = columns
+
+
+def _convert_location(location):
+    result = Aviv.BibTime.convert_many(_WORKER['dates'], location,
+                                       _WORKER['geocoder'])
+    if _WORKER['columns'] is not None:
+        result = {name: result[name] for name in _WORKER['columns']}
+    return location, result
+
+
+def convert_parallel(locations,
+                     dates,
+                     workers=None,
+                     geocoder='astral',
+                     columns=None,
+                     chunksize=1):
+    """Converts dates at each of locations, using a pool of workers
+    processes (by default one per CPU).
+
+    locations are city names or astral Locations, and dates are converted
+    just like by `BibTime.convert_many`. columns is a list of the columns
+    to return, all of them by default; asking for fewer means less to send
+    back from the workers.
+
+    Returns a generator of (location, columns) pairs, in the order of
+    locations. They are yielded as soon as they are ready, chunksize
+    locations at a time."""
+    dates = list(dates)
+    if columns is not None:
+        columns = tuple(columns)
+    snapshot = data.MOON_DATA.snapshot()
+    month_index = snapshot.month_index
+    start_times = month_index.start_times
+    if start_times is not None:
+        start_times = array.array('q', start_times)
+    initargs = (array.array('i', month_index.ordinals),
+                array.array('I', month_index.keys),
+                array.array('B', month_index.is_known), start_times,
+                snapshot.aviv_barley, snapshot.last_moon, dates, geocoder,
+                columns)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=initargs) as executor:
+        for result in executor.map(_convert_location,
+                                   locations,
+                                   chunksize=chunksize):
+            yield result
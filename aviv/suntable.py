@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""A compact binary file format for the sunrise and sunset of a location."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Stores the sunrise and sunset of every date in a window of years at one
+# location, worked out in advance by astral, as fixed width binary columns
+# that can be memory mapped. See astro.precompute_sun_tables.
+
+# CURRENT STATUS:
+# Layout of version 1, all little endian:
+#   header:   magic b'AVST', version (uint16), reserved (uint16),
+#             ordinal of the first date (int32), count (uint32),
+#             latitude, longitude and elevation (float64),
+#             time zone (32 bytes of UTF-8, padded with NUL).
+#   sunrises: count * int64, the sunrise of each date as a POSIX
+#             timestamp.
+#   sunsets:  count * int64, the sunset of each date as a POSIX timestamp.
+# A date without a sunrise or sunset (or with no dawn or dusk, which
+# astral won't calculate the sun without) is stored as MISSING in both.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import array
+import datetime
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from astral import AstralError
+
+MAGIC = b'AVST'
+VERSION = 1
+HEADER = struct.Struct('<4sHHiIddd32s')
+
+# Stored for dates that have no sunrise or sunset.
+MISSING = -2**63
+
+# As for moon tables, the file is read into memory on Windows, which won't
+# replace a file that is mapped.
+USE_MMAP = os.name != 'nt'
+
+
+def write_sun_table(path, location, first_year, last_year):
+    """Writes the sunrise and sunset of every date from first_year through
+    last_year at location (an astral Location) to a file at path.
+
+    Like a moon table, the file is written next to path first and then
+    moved into place."""
+    first = datetime.date(first_year, 1, 1).toordinal()
+    last = datetime.date(last_year, 12, 31).toordinal()
+    sunrises = array.array('q')
+    sunsets = array.array('q')
+    for ordinal in range(first, last + 1):
+        try:
+            sun = location.sun(date=datetime.date.fromordinal(ordinal),
+                               local=True)
+        except AstralError:
+            sunrises.append(MISSING)
+            sunsets.append(MISSING)
+            continue
+        sunrises.append(int(sun['sunrise'].timestamp()))
+        sunsets.append(int(sun['sunset'].timestamp()))
+    if sys.byteorder != 'little':
+        sunrises.byteswap()
+        sunsets.byteswap()
+
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with open(tmp_fd, 'wb') as out_file:
+        out_file.write(
+            HEADER.pack(MAGIC, VERSION, 0, first, len(sunsets),
+                        location.latitude, location.longitude,
+                        location.elevation,
+                        location.timezone.encode('utf-8')))
+        out_file.write(sunrises.tobytes())
+        out_file.write(sunsets.tobytes())
+    os.replace(tmp_path, path)
+
+
+class SunTable:
+    """A sun table file, memory mapped for reading (or read into memory
+    if USE_MMAP is False).
+
+    `sunrises` and `sunsets` are views straight into the mapped file, one
+    per date from the date with ordinal `first`. latitude, longitude,
+    elevation and timezone are those of the location."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as in_file:
+            if USE_MMAP:
+                self._mmap = mmap.mmap(in_file.fileno(),
+                                       0,
+                                       access=mmap.ACCESS_READ)
+            else:
+                self._mmap = in_file.read()
+        if len(self._mmap) < HEADER.size:
+            raise Exception('{} is not a sun table.'.format(path))
+        (magic, version, _, self.first, count, self.latitude, self.longitude,
+         self.elevation, timezone) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise Exception('{} is not a sun table.'.format(path))
+        if version != VERSION:
+            raise Exception('Unsupported sun table version: {}'.format(
+                version))
+        if len(self._mmap) < HEADER.size + 16 * count:
+            raise Exception('{} is truncated.'.format(path))
+        self.timezone = timezone.rstrip(b'\0').decode('utf-8')
+        self.sunrises = self._column(HEADER.size, count)
+        self.sunsets = self._column(HEADER.size + 8 * count, count)
+
+    def __len__(self):
+        return len(self.sunsets)
+
+    def _column(self, offset, count):
+        view = memoryview(self._mmap)[offset:offset + 8 * count]
+        if sys.byteorder == 'little':
+            return view.cast('q')
+        # On big endian machines the column has to be copied and swapped.
+        column = array.array('q', view.tobytes())
+        column.byteswap()
+        return column
+
+    @property
+    def first_date(self):
+        """The first date in the table."""
+        return datetime.date.fromordinal(self.first)
+
+    @property
+    def last_date(self):
+        """The last date in the table."""
+        return datetime.date.fromordinal(self.first + len(self) - 1)
+
+    def events(self, date):
+        """Returns the (sunrise, sunset) timestamps of date, or None if date
+        is not in the table or has no sunrise or sunset."""
+        position = date.toordinal() - self.first
+        if not 0 <= position < len(self.sunsets):
+            return None
+        sunset = self.sunsets[position]
+        if sunset == MISSING:
+            return None
+        return (self.sunrises[position], sunset)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Tracing of the calculations in aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Detailed traces of how a date is converted, only paid for when asked
+# for. Hot paths check ENABLED before building any message:
+#   if trace.ENABLED:
+#       trace.trace('b_day (day of month) is %s', b_day)
+
+# CURRENT STATUS:
+# Off by default. `enable()` sends the traces to logging.debug, or to any
+# other sink, like a TraceRecorder.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import logging
+
+# True while tracing is on. Check it before calling `trace`.
+ENABLED = False
+
+_sink = None
+
+
+def enable(sink=logging.debug):
+    """Turns tracing on. Traces are passed to sink as (message, *args),
+    like to logging.debug, which is the default."""
+    global ENABLED, _sink
+    _sink = sink
+    ENABLED = True
+
+
+def disable():
+    """Turns tracing off."""
+    global ENABLED, _sink
+    ENABLED = False
+    _sink = None
+
+
+def trace(message, *args):
+    """Passes message and args on to the sink, if tracing is on."""
+    sink = _sink
+    if sink is not None:
+        sink(message, *args)
+
+
+class TraceRecorder:
+    """A sink that keeps the traces, as (message, args) in `records`.
+
+    Example: trace.enable(recorder)"""
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, message, *args):
+        self.records.append((message, args))
+
+    def messages(self):
+        """Returns the traces formatted as strings."""
+        return [message % args for message, args in self.records]
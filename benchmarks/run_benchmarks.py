@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Benchmarks for the hot paths of aviv-calendar."""
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Times the conversion hot paths of aviv-calendar and writes the results
+# to a JSON file, so that releases can be compared against each other.
+
+# CURRENT STATUS:
+# Runs offline. The latest data is served by a stub HTTP server on
+# localhost, and the DB is written to a temporary directory.
+# Usage:
+#   python benchmarks/run_benchmarks.py [--output results.json]
+#                                       [--compare old.json]
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+import argparse
+import datetime
+import http.server
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aviv import Aviv  # noqa: E402
+from aviv import astro  # noqa: E402
+from aviv import data  # noqa: E402
+from aviv import hist_data  # noqa: E402
+from aviv import instrument  # noqa: E402
+from aviv.geocoder import LOCATION_POOL  # noqa: E402
+
+# Results more than this much slower than in the file compared against are
+# reported as regressions.
+DEFAULT_THRESHOLD = 0.2
+
+
+def stub_latest_data():
+    """Returns latest data made from hist_data, in the JSON format served by
+    avivcalendar.com."""
+    last_key = max(hist_data.MOONS)
+    return json.dumps({
+        'LAST_MOON': {
+            last_key: hist_data.MOONS[last_key]
+        },
+        'NEXT_MOON': {},
+        'AVIV_BARLEY': True
+    }).encode('utf-8')
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    body = b''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server():
+    """Starts a stub of the latest data endpoint on localhost.
+
+    Returns the server and its URL."""
+    _StubHandler.body = stub_latest_data()
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://127.0.0.1:{}/latest-data'.format(server.server_address[1])
+    return server, url
+
+
+def clear_caches():
+    """Empties all the caches, to time a cold start."""
+    instrument.clear_caches()
+    data.MOON_DATA.month_index.clear_start_times()
+    LOCATION_POOL.clear()
+
+
+def bench(func, number=1, repeat=5, setup=None):
+    """Times func, called number times in a row, repeat times.
+
+    setup is called before each repeat, outside of the timing. Returns the
+    timings per call in seconds."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return timings
+
+
+def import_time():
+    """Times `from aviv import Aviv` in a fresh interpreter."""
+    code = ('import time\n'
+            'start = time.perf_counter()\n'
+            'from aviv import Aviv\n'
+            'print(time.perf_counter() - start)\n')
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output([sys.executable, '-c', code],
+                                     cwd=tempfile.gettempdir(),
+                                     env=env,
+                                     universal_newlines=True)
+    return float(output.strip())
+
+
+def run_benchmarks(quick=False):
+    """Runs all the benchmarks. Returns a dict of name: timings."""
+    scale = 1 if quick else 5
+    results = {}
+    location = Aviv.resolve_location('Jerusalem')
+    month_index = data.MOON_DATA.month_index
+    moment = datetime.datetime(2018, 3, 1, 12)
+
+    results['import_aviv'] = [import_time() for _ in range(scale)]
+    results['bib_time_cold'] = bench(
+        lambda: Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 1, 12),
+        repeat=5 * scale,
+        setup=clear_caches)
+    results['bib_time_warm'] = bench(
+        lambda: Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 1, 12),
+        number=20 * scale)
+    results['find_month'] = bench(
+        lambda: month_index.find_key(moment, True), number=1000 * scale)
+    results['find_firstfruits_cold'] = bench(
+        lambda: Aviv.find_firstfruits(6018, 1, 22),
+        repeat=5 * scale,
+        setup=Aviv.YEAR_CALENDARS.clear)
+    results['find_firstfruits_warm'] = bench(
+        lambda: Aviv.find_firstfruits(6018, 1, 22), number=1000 * scale)
+
+    b_location = Aviv.BibLocation(location, 'astral', 2018, 3, 1, 12)
+    results['sun_status_cold'] = bench(b_location.sun_status,
+                                       repeat=5 * scale,
+                                       setup=astro.SUN_CACHE.clear)
+    results['sun_status_warm'] = bench(b_location.sun_status,
+                                       number=1000 * scale)
+
+    start = datetime.datetime(2009, 1, 1, 12)
+    dates = [start + datetime.timedelta(days=i) for i in range(3653)]
+    results['convert_many_10_years'] = bench(
+        lambda: Aviv.BibTime.convert_many(dates, location),
+        repeat=scale,
+        setup=clear_caches)
+    results['iter_days_10_years'] = bench(
+        lambda: sum(1 for _ in Aviv.iter_days(dates[0], dates[-1], location)),
+        repeat=scale,
+        setup=clear_caches)
+    return results
+
+
+def summarize(timings):
+    """Returns the statistics of a list of timings."""
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'rounds': len(timings)
+    }
+
+
+def compare(results, old_results, threshold=DEFAULT_THRESHOLD):
+    """Returns the names of the benchmarks that are more than threshold
+    slower than in old_results, comparing the medians."""
+    regressions = []
+    for name, stats in sorted(results.items()):
+        old_stats = old_results.get(name)
+        if old_stats is None:
+            continue
+        if stats['median'] > old_stats['median'] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    """Runs the benchmarks and writes the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output',
+                        default='benchmark_results.json',
+                        help='JSON file to write the results to.')
+    parser.add_argument('--compare',
+                        help='JSON file of earlier results to compare with.')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=DEFAULT_THRESHOLD,
+                        help='Slowdown reported as a regression. '
+                        'Default: %(default)s')
+    parser.add_argument('--quick',
+                        action='store_true',
+                        help='Fewer rounds, for a smoke test.')
+    args = parser.parse_args()
+
+    server, url = start_stub_server()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data.LATEST_DATA_URL = url
+        data.DB_FILE = os.path.join(tmp_dir, 'current_data.avmt')
+        data.LATEST_DATA_FILE = os.path.join(tmp_dir, 'latest_data.dat')
+        data.MOON_DATA.clear()
+        # Build the DB up front, rather than timing the historical data
+        # while it is fetched in the background.
+        data.combine_data()
+        data.preload()
+        results = {
+            name: summarize(timings)
+            for name, timings in run_benchmarks(args.quick).items()
+        }
+        data.REFRESHER.wait()
+    server.shutdown()
+
+    report = {
+        'created': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    with open(args.output, 'w') as out_file:
+        json.dump(report, out_file, indent=2, sort_keys=True)
+
+    for name, stats in sorted(results.items()):
+        print('{:<24}{:>12.6f}s'.format(name, stats['median']))
+
+    if args.compare is not None:
+        with open(args.compare) as in_file:
+            old_results = json.load(in_file)['results']
+        regressions = compare(results, old_results, args.threshold)
+        for name in regressions:
+            print('Regression: {} {:.6f}s -> {:.6f}s'.format(
+                name, old_results[name]['median'], results[name]['median']))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
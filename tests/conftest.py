@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Fixtures shared by the tests of aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Keeps every test offline, with a DB of its own.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+
+import pytest
+from aviv import data
+
+
+@pytest.fixture(autouse=True)
+def offline(tmp_path, monkeypatch):
+    """Points the DB to tmp_path and makes every fetch fail, so that every
+    test runs on hist_data and never touches the network."""
+
+    def no_connection():
+        raise data.LatestDataError('No connection in tests.')
+
+    monkeypatch.setattr(data, 'DB_FILE', str(tmp_path / 'current_data.avmt'))
+    monkeypatch.setattr(data, 'LATEST_DATA_FILE',
+                        str(tmp_path / 'latest_data.dat'))
+    monkeypatch.setattr(data, 'get_latest_data', no_connection)
+    monkeypatch.setattr(data, 'REFRESHER', data.DataRefresher())
+    data.MOON_DATA.clear()
+    yield tmp_path
+    data.REFRESHER.wait(5)
+    data.MOON_DATA.clear()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Tests for the asyncio API of aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tests for the asyncio API of aviv-calendar.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# -- END OF INTRO -- #
+
+import asyncio
+import time
+from aviv import Aviv
+from aviv import aio
+
+CITIES = ('Jerusalem', 'London', 'Stockholm', 'New York')
+
+
+def test_gather_agrees_with_bib_time():
+    """Many locations can be converted at once with asyncio.gather."""
+
+    async def convert():
+        return await asyncio.gather(*(aio.AsyncBibTime.create(
+            city, 'astral', 2018, 3, 17, 20) for city in CITIES))
+
+    for city, async_time in zip(CITIES, asyncio.run(convert())):
+        d = Aviv.BibTime(city, 'astral', 2018, 3, 17, 20)
+        assert async_time.b_location.location.name == city
+        assert async_time.b_time.year == d.b_time.year
+        assert async_time.b_time.month == d.b_time.month
+        assert async_time.b_time.day == d.b_time.day
+        assert async_time.b_time.sabbath.weekly_sabbath == \
+            d.b_time.sabbath.weekly_sabbath
+
+
+def test_slow_lookups_do_not_block_the_loop(monkeypatch):
+    """The event loop keeps running while a city is looked up."""
+    resolve_location = Aviv.resolve_location
+
+    def slow_resolve_location(city_name, geocoder='astral'):
+        time.sleep(0.3)
+        return resolve_location(city_name, geocoder)
+
+    monkeypatch.setattr(Aviv, 'resolve_location', slow_resolve_location)
+
+    async def tick(ticks, done):
+        while not done.is_set():
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def convert():
+        ticks = []
+        done = asyncio.Event()
+        ticker = asyncio.ensure_future(tick(ticks, done))
+        await aio.AsyncBibTime.create('Jerusalem', 'astral', 2018, 3, 17, 20)
+        done.set()
+        await ticker
+        return len(ticks)
+
+    assert asyncio.run(convert()) > 10
@@ -30,9 +30,13 @@
 
 import datetime
 import logging
-import shelve
+import pytest
 # from astral import AstralError
 from aviv import Aviv
+from aviv import hist_data
+from aviv.month_index import MonthIndex
+
+FIXED_YOM_KIPPUR = 'Yom Kippur / "Day of Atonement"'
 
 logging.basicConfig(
     level=logging.CRITICAL,
@@ -75,8 +79,7 @@ def test_known_reference_days():
         ref_b_year = value[0][0]
         ref_b_month = value[0][1]
         ref_b_day = value[0][2]
-        ref_month_start_date = datetime.datetime(*value[1]).replace(
-            tzinfo=d.b_location.location.tzinfo)
+        ref_month_start_date = datetime.date(*value[1])
         ref_weekday = value[2]
         ref_g_weekday = value[3]
         ref_sabbath = value[4]
@@ -85,7 +88,10 @@ def test_known_reference_days():
         assert result_b_year == ref_b_year
         assert result_b_month == ref_b_month
         assert result_b_day == ref_b_day
-        assert result_month_start_date == ref_month_start_date
+        # The month starts at sunset in Jerusalem.
+        assert result_month_start_date.date() == ref_month_start_date
+        assert result_month_start_date == Aviv.astro.sun_events(
+            d.b_location.location, ref_month_start_date)[1]
         assert result_weekday == ref_weekday
         assert result_g_weekday == ref_g_weekday
         assert result_sabbath == ref_sabbath
@@ -94,8 +100,7 @@ def test_known_reference_days():
 
 def test_length_of_months():
     """Tests the length of months in the database. Should be 28-30 days."""
-    db = shelve.open(Aviv.DB_FILE)
-    moons = db['MOONS']
+    moons = Aviv.MOONS
     start_date_list = []
     accepted_length = (28, 29, 30)
     for value in moons.values():
@@ -116,6 +121,189 @@ def test_length_of_months():
         logging.debug('reached the end of the list')
 
 
+def test_month_index():
+    """Tests that the month index finds the month a date belongs to."""
+    index = MonthIndex(Aviv.MOONS)
+    for position in range(1, len(index)):
+        start = index.start_date(position)
+        key = index.keys[position]
+        previous_key = index.keys[position - 1]
+        # The month starts at sunset on the date in MOONS.
+        assert index.find_key(start, False) == previous_key
+        assert index.find_key(start, True) == key
+        for days in range(1, index.ordinals[position] -
+                          index.ordinals[position - 1]):
+            date = start - datetime.timedelta(days=days)
+            assert index.find_key(date, False) == previous_key
+    last = index.start_date(len(index) - 1)
+    with pytest.raises(Exception, match='No potential month found'):
+        index.find_key(last + datetime.timedelta(days=31), False)
+
+
+def test_convert_many():
+    """Tests that bulk conversion agrees with BibTime."""
+    dates = []
+    start = datetime.datetime(2016, 4, 1)
+    for days in range(0, 80, 3):
+        for hour in (6, 12, 22):
+            dates.append(start + datetime.timedelta(days=days, hours=hour))
+    columns = Aviv.BibTime.convert_many(dates, 'Jerusalem')
+    assert len(columns['year']) == len(dates)
+    for i, date in enumerate(dates):
+        d = Aviv.BibTime('Jerusalem', 'astral', date.year, date.month,
+                         date.day, date.hour)
+        assert columns['g_time'][i] == d.b_location.g_time
+        assert columns['year'][i] == d.b_time.year
+        assert columns['month'][i] == d.b_time.month
+        assert columns['day'][i] == d.b_time.day
+        assert columns['weekday'][i] == d.b_time.weekday
+        assert columns['sabbath'][i] == d.b_time.sabbath.sabbath
+        assert columns['high_feast_day'][i] == d.b_time.sabbath.high_feast_day
+        assert columns['omer_count'][i] == d.b_time.sabbath.omer_count
+
+
+def test_year_calendar():
+    """Tests the feast days worked out for a whole year."""
+    calendar = Aviv.year_calendar(6015)
+    assert calendar is Aviv.year_calendar(6015)
+    assert calendar.firstfruits == (6015, 1, 22)
+    assert calendar.shavuot == (6015, 3, 12)
+    assert calendar.shavuot_date == datetime.date(2015, 5, 31)
+    assert calendar.omer == (calendar.firstfruits_date, calendar.shavuot_date)
+    assert len(calendar.hanukkah) == 8
+    assert calendar.hanukkah[-1][1] == '8th day of Hanukkah'
+    assert calendar.fixed_feasts[(7, 10)][2] == FIXED_YOM_KIPPUR
+    assert calendar.feast_status(7, 10) == (True, True, FIXED_YOM_KIPPUR,
+                                            None)
+    assert calendar.feast_status(3, 12) == (True, True,
+                                            'Shavuot / "The feast of Weeks"',
+                                            49)
+    assert calendar.feast_status(4, 1) == (False, False, None, None)
+
+
+def test_year_calendar_with_months_to_come():
+    """Feasts in months that aren't in the data yet are left out."""
+    moons = {key: value for key, value in hist_data.MOONS.items()
+             if key <= 601802}
+    calendar = Aviv.YearCalendar(6018, MonthIndex(moons))
+    assert calendar.firstfruits is not None
+    assert calendar.shavuot is None
+    assert calendar.feast_status(2, 40)[:3] == (False, False, None)
+    assert all(day[5] != 'Shavuot / "The feast of Weeks"'
+               for day in calendar.feast_days)
+
+    moons = {key: value for key, value in hist_data.MOONS.items()
+             if key <= 601809}
+    calendar = Aviv.YearCalendar(6018, MonthIndex(moons))
+    assert [day[0][2] for day in calendar.hanukkah] == [25, 26, 27, 28]
+
+
+def test_iter_days():
+    """Tests that the days of a range agree with bulk conversion."""
+    start = datetime.date(2015, 12, 20)
+    end = datetime.date(2016, 7, 1)
+    days = Aviv.iter_days(start, end, 'Jerusalem')
+    dates = [
+        start + datetime.timedelta(days=i)
+        for i in range((end - start).days + 1)
+    ]
+    columns = Aviv.BibTime.convert_many(dates, 'Jerusalem')
+    count = 0
+    for i, day in enumerate(days):
+        assert day.g_date == dates[i]
+        assert day.year == columns['year'][i]
+        assert day.month == columns['month'][i]
+        assert day.day == columns['day'][i]
+        assert day.weekday == columns['weekday'][i]
+        assert day.sabbath == columns['sabbath'][i]
+        assert day.feast_name == columns['feast_name'][i]
+        assert day.omer_count == columns['omer_count'][i]
+        assert day.sunset.date() == day.g_date
+        count += 1
+    assert count == len(dates)
+
+
+def test_bib_day_to_columns():
+    """Tests that the biblical days are slotted and can be made columns."""
+    times = [
+        Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 31, 20),
+        Aviv.BibTime('Jerusalem', 'astral', 2018, 4, 1, 20)
+    ]
+    b_days = [d.b_time for d in times]
+    assert not hasattr(b_days[0], '__dict__')
+    assert b_days[0].sabbath.feast_name == 'Passover'
+    columns = Aviv.to_columns(b_days)
+    assert set(columns) == set(Aviv.BIB_DAY_COLUMNS)
+    assert columns['day'] == [b_day.day for b_day in b_days]
+    assert columns['feast_name'] == ['Passover', '1st day of Unleavened Bread']
+    assert columns['sabbath'] == [False, True]
+
+
+def test_update_time_is_incremental():
+    """Tests that update_time only recalculates at sunset and sunrise."""
+    d = Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 31, 12)
+    sunset = d.b_location.sun_info['sunset']
+    times = []
+    d.b_location._set_g_time_now = lambda: times.pop(0)
+
+    times.append(sunset - datetime.timedelta(minutes=2))
+    d.update_time()
+    b_time = d.b_time
+    assert d.next_transition == sunset
+    calls = []
+    sun_status = d.b_location.sun_status
+    d.b_location.sun_status = lambda: calls.append(sun_status())
+
+    times.append(sunset - datetime.timedelta(minutes=1))
+    d.update_time()
+    assert calls == []
+    assert d.b_time is b_time
+
+    times.append(sunset + datetime.timedelta(minutes=1))
+    d.update_time()
+    assert len(calls) == 1
+    assert d.b_time is not b_time
+    assert d.b_time.weekday != b_time.weekday
+    assert d.next_transition > sunset
+
+
+def test_for_locations(monkeypatch):
+    """Tests that one instant at many locations agrees with bulk conversion,
+    and that the feasts are only worked out once per biblical day."""
+    cities = ['Jerusalem', 'London', 'Stockholm', 'New York', 'Tokyo',
+              'Honolulu', 'Paris', 'Berlin']
+    instant = datetime.datetime(2018, 3, 30, 17)
+    calls = []
+    feast_status = Aviv.feast_status
+
+    def counting_feast_status(*args):
+        calls.append(args[:3])
+        return feast_status(*args)
+
+    monkeypatch.setattr(Aviv, 'feast_status', counting_feast_status)
+    columns = Aviv.BibTime.for_locations(instant, cities)
+    assert columns['location'] == cities
+    assert len(calls) == len(set(calls)) == 2
+    monkeypatch.undo()
+
+    for i, city in enumerate(cities):
+        expected = Aviv.BibTime.convert_many(
+            [instant.replace(tzinfo=datetime.timezone.utc)], city)
+        for name, values in expected.items():
+            assert columns[name][i] == values[0]
+        assert columns['sunset'][i].date() == columns['g_time'][i].date()
+    # The sun has set in Jerusalem and Tokyo, but not further west.
+    assert columns['sabbath'] == [
+        True, False, False, False, True, False, False, False
+    ]
+
+
 if __name__ == '__main__':
     test_known_reference_days()
     test_length_of_months()
+    test_month_index()
+    test_convert_many()
+    test_year_calendar()
+    test_iter_days()
+    test_bib_day_to_columns()
+    test_update_time_is_incremental()
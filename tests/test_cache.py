@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Tests for the caches in aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tests for the caches in aviv-calendar.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+
+import datetime
+import pytest
+from aviv import Aviv
+from aviv import astro
+from aviv.cache import LRUCache
+from aviv.geocoder import OfflineGeocoder
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """The entry used longest ago is the one evicted."""
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.get('b') is None
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2}
+    cache.resize(1)
+    assert len(cache) == 1
+    assert 'c' in cache
+
+
+def test_sun_status_uses_sun_cache():
+    """The sun is only calculated once per location and date."""
+    astro.SUN_CACHE.clear()
+    first = Aviv.BibLocation('Jerusalem', 'astral', 2018, 3, 1, 12)
+    assert astro.SUN_CACHE.misses == 1
+    second = Aviv.BibLocation('jerusalem', 'astral', 2018, 3, 1, 20)
+    assert astro.SUN_CACHE.misses == 1
+    assert astro.SUN_CACHE.hits == 1
+    assert first.sun_info['sunset'] == second.sun_info['sunset']
+    assert first.sun_info['has_set'] is False
+    assert second.sun_info['has_set'] is True
+
+
+def test_iter_days_leaves_the_sun_cache_alone():
+    """Walking a long range of dates doesn't fill the sun cache."""
+    start = datetime.date(2012, 1, 1)
+    end = datetime.date(2017, 12, 31)
+    # The month starts are looked up once, the first time.
+    sum(1 for _ in Aviv.iter_days(start, end, 'Jerusalem'))
+    astro.SUN_CACHE.clear()
+    Aviv.BibLocation('Jerusalem', 'astral', 2018, 3, 1, 12)
+    days = list(Aviv.iter_days(start, end, 'Jerusalem'))
+    assert len(days) == (end - start).days + 1
+    assert len(astro.SUN_CACHE) == 1
+    location = Aviv.resolve_location('Jerusalem')
+    assert days[-1].sunset == astro.sun_events(location, end)[1]
+
+
+def test_moon_phase_cache_and_table():
+    """Moon phases are cached by date, and the precomputed window agrees
+    with astral."""
+    astro.MOON_PHASE_CACHE.clear()
+    date = datetime.date(2018, 3, 17)
+    location = Aviv.resolve_location('Jerusalem')
+    assert astro.moon_phase(date) == location.moon_phase(date=date)
+    assert astro.moon_phase(datetime.datetime(2018, 3, 17, 23)) == \
+        astro.moon_phase(date)
+    assert astro.MOON_PHASE_CACHE.misses == 1
+    assert astro.MOON_PHASE_CACHE.hits == 2
+
+    astro.precompute_moon_phases(2018, 2018)
+    try:
+        for day in range(0, 365, 7):
+            other = date.replace(month=1, day=1) + datetime.timedelta(day)
+            assert astro.moon_phase(other) == location.moon_phase(date=other)
+        assert astro.MOON_PHASE_CACHE.misses == 1
+    finally:
+        astro._PHASE_TABLE = None
+
+
+def test_sun_tables(tmp_path):
+    """Sunrise and sunset are read from the sun tables where covered, and
+    agree with astral to the second."""
+    location = OfflineGeocoder()['Jerusalem']
+    expected = {}
+    for day in range(0, 730, 13):
+        date = datetime.date(2018, 1, 1) + datetime.timedelta(day)
+        sun = location.sun(date=date, local=True)
+        expected[date] = (sun['sunrise'], sun['sunset'])
+
+    tables = astro.precompute_sun_tables(['Jerusalem'], 2018, 2019,
+                                         str(tmp_path))
+    try:
+        assert tables[0].first_date == datetime.date(2018, 1, 1)
+        assert tables[0].last_date == datetime.date(2019, 12, 31)
+        path = astro.sun_table_path(str(tmp_path), location)
+        modified = (tmp_path / path).stat().st_mtime_ns
+        astro.precompute_sun_tables([location], 2018, 2018, str(tmp_path))
+        assert (tmp_path / path).stat().st_mtime_ns == modified
+
+        astro.SUN_CACHE.clear()
+        location.sun = None
+        for date, events in expected.items():
+            assert astro.sun_events(location, date) == events
+            assert astro.sun_events(location, date)[1].utcoffset() == \
+                events[1].utcoffset()
+        with pytest.raises(TypeError):
+            astro.sun_events(location, datetime.date(2020, 1, 1))
+
+        d = Aviv.BibLocation('Jerusalem', 'astral', 2018, 3, 7, 20)
+        assert d.sun_info['sunset'] == \
+            expected[datetime.date(2018, 3, 7)][1]
+    finally:
+        astro.clear_sun_tables()
+        astro.SUN_CACHE.clear()
+
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""Tests for the data handling in aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tests for the loading of moon data in aviv-calendar.
+
+# CURRENT STATUS:
+# Runs offline. Nothing is fetched from avivcalendar.com.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+
+import datetime
+import http.server
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from aviv import Aviv
+from aviv import astro
+from aviv import data
+from aviv import hist_data
+from aviv import moontable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_is_free_from_side_effects(tmp_path):
+    """Importing aviv.Aviv should neither load nor create any data."""
+    code = ('import time\n'
+            'start = time.perf_counter()\n'
+            'from aviv import Aviv\n'
+            'print(time.perf_counter() - start)\n'
+            'assert not Aviv.data.MOON_DATA.loaded\n')
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run([sys.executable, '-c', code],
+                            cwd=str(tmp_path),
+                            env=env,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    assert result.returncode == 0, result.stderr
+    print('import time: {}s'.format(result.stdout.strip()))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_preload_falls_back_to_hist_data(offline):
+    """Without a DB or a connection the historical data is used."""
+    assert not data.MOON_DATA.loaded
+    data.preload()
+    assert data.MOON_DATA.loaded
+    assert data.MOON_DATA.moons == hist_data.MOONS
+    assert data.MOON_DATA.aviv_barley is None
+    last_moon_key = list(data.MOON_DATA.last_moon.keys())[0]
+    assert last_moon_key in hist_data.MOONS
+    # The DB is fetched in the background, without holding anything up.
+    assert data.REFRESHER.wait(5)
+    assert data.REFRESHER.stats()['failures'] == 1
+    assert not data.db_exists()
+
+
+def test_first_use_fetches_in_the_background(stub_server):
+    """Without a DB the historical data is used until the refresher has
+    created one."""
+    data.preload()
+    assert data.MOON_DATA.aviv_barley is None
+    assert data.REFRESHER.wait(5)
+    assert data.db_exists()
+    assert data.MOON_DATA.aviv_barley is True
+
+
+def test_preload_can_wait_for_the_db(stub_server):
+    """With wait=True, preload only returns once the DB has been created."""
+    data.preload(wait=True, timeout=5)
+    assert data.db_exists()
+    assert data.MOON_DATA.aviv_barley is True
+    assert 601807 in data.MOON_DATA.moons
+
+
+def test_moon_table_round_trip(offline):
+    """A moon table reads back exactly what was written, and is used as DB."""
+    moontable.write_moon_table(data.DB_FILE, hist_data.MOONS, True)
+    table = moontable.MoonTable(data.DB_FILE)
+    assert len(table) == len(hist_data.MOONS)
+    assert table.to_moons() == hist_data.MOONS
+    assert table.aviv_barley is True
+    assert list(table.ordinals) == sorted(table.ordinals)
+    first_start = datetime.date.fromordinal(table.ordinals[0])
+    assert table.start_times[0] == astro.month_start_timestamp(first_start)
+
+    assert data.MOON_DATA.aviv_barley is True
+    month_index = data.MOON_DATA.month_index
+    assert isinstance(month_index.ordinals, memoryview)
+    assert month_index.find_key(datetime.datetime(2018, 3, 19)) == 601801
+    assert data.MOON_DATA.moons == hist_data.MOONS
+
+
+def test_moon_table_leaves_the_sun_cache_alone(offline):
+    """Writing a moon table doesn't fill the sun cache with old months."""
+    astro.SUN_CACHE.clear()
+    moontable.write_moon_table(data.DB_FILE, hist_data.MOONS)
+    assert len(astro.SUN_CACHE) == 0
+
+
+def test_moon_table_without_mmap(offline, monkeypatch):
+    """Without mmap, as on Windows, the table is read into memory and the
+    file can be replaced while the old table is in use."""
+    monkeypatch.setattr(moontable, 'USE_MMAP', False)
+    moontable.write_moon_table(data.DB_FILE, hist_data.MOONS, True)
+    table = moontable.MoonTable(data.DB_FILE)
+    assert isinstance(table._mmap, bytes)
+    moontable.write_moon_table(data.DB_FILE, hist_data.MOONS, False)
+    assert table.to_moons() == hist_data.MOONS
+    assert table.aviv_barley is True
+    assert moontable.MoonTable(data.DB_FILE).aviv_barley is False
+
+
+def test_refresher_runs_in_the_background(offline, monkeypatch):
+    """maybe_refresh returns at once and refreshes at most once per
+    interval, swapping the new data in when done."""
+    data.preload()
+    old_version = data.MOON_DATA.version
+    started = threading.Event()
+    release = threading.Event()
+
+    def fake_combine():
+        started.set()
+        release.wait(5)
+        moontable.write_moon_table(data.DB_FILE, hist_data.MOONS, False)
+        data.MOON_DATA.reload()
+
+    monkeypatch.setattr(data, 'combine_data', fake_combine)
+    refresher = data.DataRefresher()
+    assert refresher.maybe_refresh() is True
+    assert started.wait(5)
+    assert refresher.running
+    assert refresher.maybe_refresh() is False
+    assert data.MOON_DATA.aviv_barley is None
+    release.set()
+    assert refresher.wait(5)
+
+    stats = refresher.stats()
+    assert stats['refreshes'] == 1
+    assert stats['last_success'] is True
+    assert stats['last_duration'] > 0
+    assert data.MOON_DATA.aviv_barley is False
+    assert data.MOON_DATA.version == old_version + 1
+    assert refresher.maybe_refresh() is False
+
+
+def test_snapshots_are_swapped_whole(offline):
+    """Readers keep the snapshot they took, whole, while new data is
+    swapped in."""
+    moontable.write_moon_table(data.DB_FILE, hist_data.MOONS, True)
+    snapshot = data.MOON_DATA.snapshot()
+    assert data.MOON_DATA.snapshot() is snapshot
+    with pytest.raises(AttributeError):
+        snapshot.aviv_barley = False
+
+    seen = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.wait(0.001):
+            current = data.MOON_DATA.snapshot()
+            seen.append((current.version, current.aviv_barley,
+                         current.month_index.keys[-1]))
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for barley in (False, True, False):
+        moontable.write_moon_table(data.DB_FILE, hist_data.MOONS, barley)
+        data.MOON_DATA.reload()
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    barley_of = {snapshot.version + i: barley
+                 for i, barley in enumerate((True, False, True, False))}
+    for version, barley, last_key in seen:
+        assert barley_of[version] is barley
+        assert last_key == max(hist_data.MOONS)
+    assert data.MOON_DATA.version == snapshot.version + 3
+    # The old snapshot still reads from the table it was made from.
+    assert snapshot.aviv_barley is True
+    assert snapshot.moons == hist_data.MOONS
+
+
+def test_last_moon_starts_at_sunset(offline, monkeypatch):
+    """The last moon only changes at sunset in Jerusalem, and is worked
+    out again as time goes by."""
+    month_index = data.MOON_DATA.month_index
+    position = month_index.positions[601801]
+    start = month_index.start_time(position)
+    before = data._find_last_moon(month_index, start - 6 * 3600)
+    assert list(before) == [month_index.keys[position - 1]]
+    assert list(data._find_last_moon(month_index, start)) == [601801]
+
+    snapshot = data.MOON_DATA.snapshot()
+    with monkeypatch.context() as patch:
+        patch.setattr(data.time, 'time', lambda: start - 60)
+        assert list(snapshot.last_moon) == [month_index.keys[position - 1]]
+        patch.setattr(data.time, 'time', lambda: start + 40 * 86400)
+        assert list(snapshot.last_moon) == [month_index.keys[position + 1]]
+
+
+def test_parse_latest_data(tmp_path):
+    """The latest data is parsed, never run, and checked month by month."""
+    last_key = max(hist_data.MOONS)
+    last_moon = {last_key: hist_data.MOONS[last_key]}
+    assignments = ('LAST_MOON = {!r}\n'
+                   'NEXT_MOON = {{}}\n'
+                   'AVIV_BARLEY = None\n').format(last_moon).encode('utf-8')
+    parsed = data.parse_latest_data(assignments)
+    assert parsed == (last_moon, {}, None)
+
+    as_json = json.dumps({
+        'LAST_MOON': last_moon,
+        'NEXT_MOON': {},
+        'AVIV_BARLEY': None
+    }).encode('utf-8')
+    assert data.parse_latest_data(as_json) == parsed
+
+    path = str(tmp_path / 'table.avmt')
+    moontable.write_moon_table(path, hist_data.MOONS, True)
+    with open(path, 'rb') as in_file:
+        parsed = data.parse_latest_data(in_file.read())
+    assert parsed.next_moon == hist_data.MOONS
+    assert parsed.aviv_barley is True
+
+    with pytest.raises(data.LatestDataError, match='Unexpected statement'):
+        data.parse_latest_data(b'import os\n' + assignments)
+    with pytest.raises(data.LatestDataError, match='not a literal'):
+        data.parse_latest_data(
+            assignments.replace(b'None', b'__import__("os")'))
+    with pytest.raises(data.LatestDataError, match='Invalid month'):
+        data.parse_latest_data(
+            assignments.replace(b'(6019, 7,', b'(6019, 8,'))
+
+    # NEXT_MOON starting 40 days after LAST_MOON.
+    start = datetime.date(*last_moon[last_key][2:5]) + \
+        datetime.timedelta(days=40)
+    next_moon = {
+        last_key + 1: (6019, 8, start.year, start.month, start.day, False)
+    }
+    with pytest.raises(data.LatestDataError, match='lasts 40 days'):
+        data.parse_latest_data(
+            assignments.replace(b'NEXT_MOON = {}',
+                                'NEXT_MOON = {!r}'.format(
+                                    next_moon).encode('utf-8')))
+
+
+def test_latest_data_is_cached(offline, monkeypatch):
+    """The latest data is only parsed again once it has been replaced, and
+    a refresh is seen without restarting."""
+    now = datetime.datetime(2018, 9, 1).timestamp()
+    monkeypatch.setattr(data.time, 'time', lambda: now)
+    assert data.read_latest_data() is None
+    moontable.write_moon_table(data.DB_FILE, hist_data.MOONS)
+    with open(data.LATEST_DATA_FILE, 'w') as out_file:
+        out_file.write('LAST_MOON = {601806: (6018, 6, 2018, 8, 11, True)}\n'
+                       'NEXT_MOON = {}\nAVIV_BARLEY = True\n')
+    first = data.read_latest_data()
+    version = data.LATEST_DATA.version
+    assert data.read_latest_data() is first
+    assert data.LATEST_DATA.version == version
+    assert data.MOON_DATA.last_moon == first.last_moon
+
+    with open(data.LATEST_DATA_FILE + '.tmp', 'w') as out_file:
+        out_file.write('LAST_MOON = {601807: (6018, 7, 2018, 9, 10, True)}\n'
+                       'NEXT_MOON = {}\nAVIV_BARLEY = True\n')
+    os.replace(data.LATEST_DATA_FILE + '.tmp', data.LATEST_DATA_FILE)
+    assert data.LATEST_DATA.version == version
+    data.MOON_DATA.reload()
+    assert data.LATEST_DATA.version == version + 1
+    assert list(Aviv.last_moon_check()[0]) == [601807]
+
+
+class _ConditionalHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    body = ('LAST_MOON = {601807: (6018, 7, 2018, 9, 10, True)}\n'
+            'NEXT_MOON = {}\n'
+            'AVIV_BARLEY = True\n').encode('utf-8')
+    etag = '"v1"'
+    clients = []
+    paths = []
+
+    def do_GET(self):
+        self.clients.append(self.client_address)
+        self.paths.append(self.path)
+        if self.path.endswith('/old-data'):
+            self.send_response(301)
+            self.send_header('Location', '/latest-data')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(offline, monkeypatch):
+    """Serves the latest data from localhost, with an ETag."""
+    _ConditionalHandler.clients = []
+    _ConditionalHandler.paths = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                             _ConditionalHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.undo()
+    monkeypatch.setattr(data, 'DB_FILE', str(offline / 'current_data.avmt'))
+    monkeypatch.setattr(data, 'LATEST_DATA_FILE',
+                        str(offline / 'latest_data.dat'))
+    monkeypatch.setattr(
+        data, 'LATEST_DATA_URL',
+        'http://127.0.0.1:{}/latest-data'.format(server.server_address[1]))
+    monkeypatch.setattr(data, 'FETCHER', data.LatestDataFetcher())
+    monkeypatch.setattr(data, 'REFRESHER', data.DataRefresher())
+    monkeypatch.setenv('no_proxy', '127.0.0.1')
+    yield server
+    data.REFRESHER.wait(5)
+    data.FETCHER.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_conditional_fetch(stub_server):
+    """The data is only downloaded and the DB only rebuilt if changed."""
+    assert data.combine_data() is True
+    data.preload()
+    version = data.MOON_DATA.version
+    assert data.MOON_DATA.aviv_barley is True
+    assert 601807 in data.MOON_DATA.moons
+
+    assert data.combine_data() is False
+    assert data.refresh_data() is True
+    assert data.FETCHER.requests == 3
+    assert data.FETCHER.not_modified == 2
+    assert data.MOON_DATA.version == version
+
+    # All three requests went over the same connection.
+    assert len(set(_ConditionalHandler.clients)) == 1
+
+    _ConditionalHandler.etag = '"v2"'
+    try:
+        assert data.combine_data() is True
+    finally:
+        _ConditionalHandler.etag = '"v1"'
+    assert data.MOON_DATA.version == version + 1
+
+
+def test_fetch_follows_redirects(stub_server):
+    """A moved URL is fetched from where it has moved to."""
+    url = data.LATEST_DATA_URL.replace('/latest-data', '/old-data')
+    assert data.FETCHER.fetch(url, data.LATEST_DATA_FILE) is True
+    assert _ConditionalHandler.paths == ['/old-data', '/latest-data']
+    assert data.read_latest_data().aviv_barley is True
+
+
+def test_fetch_through_proxy(stub_server, monkeypatch):
+    """The proxy in http_proxy is asked for the whole URL."""
+    for name in ('HTTP_PROXY', 'http_proxy', 'NO_PROXY', 'no_proxy'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('http_proxy',
+                       'http://127.0.0.1:{}'.format(stub_server.server_port))
+    url = 'http://aviv.invalid/latest-data'
+    assert data.FETCHER.fetch(url, data.LATEST_DATA_FILE) is True
+    assert _ConditionalHandler.paths == [url]
+
+
+def test_failed_rebuild_is_done_again(stub_server, monkeypatch):
+    """If the DB couldn't be built from the data saved, it is built the
+    next time, even though the data hasn't changed."""
+    write_moon_table = data.write_moon_table
+
+    def full_disk(*args):
+        monkeypatch.setattr(data, 'write_moon_table', write_moon_table)
+        raise OSError(28, 'No space left on device')
+
+    moontable.write_moon_table(data.DB_FILE, hist_data.MOONS)
+    monkeypatch.setattr(data, 'write_moon_table', full_disk)
+    with pytest.raises(OSError):
+        data.combine_data()
+    assert data.MOON_DATA.aviv_barley is None
+
+    assert data.combine_data() is True
+    assert data.FETCHER.not_modified == 1
+    assert data.MOON_DATA.aviv_barley is True
+    assert data.combine_data() is False
+
+
+
+def test_rebuilds_are_serialized(stub_server, monkeypatch):
+    """The refresher and refresh_data can run at the same time without
+    getting in the way of each other."""
+    write_moon_table = data.write_moon_table
+    writing = []
+    overlaps = []
+
+    def slow_write(*args):
+        overlaps.append(len(writing))
+        writing.append(True)
+        time.sleep(0.05)
+        write_moon_table(*args)
+        writing.pop()
+
+    # Have every call rebuild the DB, even though the data hasn't changed.
+    monkeypatch.setattr(data, '_db_is_current', lambda: False)
+    monkeypatch.setattr(data, 'write_moon_table', slow_write)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(data.refresh_data()))
+        for _ in range(4)
+    ]
+    # Without a DB, the first use starts the refresher.
+    data.preload()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert data.REFRESHER.wait(5)
+    assert results == [True] * 4
+    assert overlaps == [0] * 5
+    assert data.REFRESHER.stats()['last_success'] is True
+    assert data.MOON_DATA.aviv_barley is True
+    assert data.FETCHER.requests == 5
+    directory = os.path.dirname(data.DB_FILE)
+    assert not [name for name in os.listdir(directory)
+                if name.endswith('.tmp')]
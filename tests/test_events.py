@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Tests for the next event queries of aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tests for the next event queries of aviv-calendar.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# -- END OF INTRO -- #
+
+import datetime
+from aviv import Aviv
+from aviv import events
+
+
+def _b_time(date):
+    return Aviv.BibTime('Jerusalem', 'astral', date.year, date.month,
+                        date.day, 12).b_time
+
+
+def test_next_feast():
+    """The next Yom Kippur starts at sunset on its eve."""
+    event = events.next_feast('yom kippur', datetime.datetime(2018, 1, 1))
+    assert event.b_date == (6018, 7, 10)
+    assert event.name == 'Yom Kippur / "Day of Atonement"'
+    location = Aviv.resolve_location('Jerusalem')
+    assert event.start == Aviv.astro.sun_events(location,
+                                                event.start.date())[1]
+    assert event.end.date() == event.start.date() + datetime.timedelta(1)
+
+    b_time = _b_time(event.end.date())
+    assert (b_time.year, b_time.month, b_time.day) == event.b_date
+    assert b_time.sabbath.feast_name == event.name
+    assert _b_time(event.start.date()).sabbath.feast_name != event.name
+
+    later = events.next_feast('yom kippur', event.start)
+    assert later.b_date == (6019, 7, 10)
+    assert events.next_feast('yom kippur', datetime.datetime(2025, 1, 1)) \
+        is None
+
+
+def test_next_sabbath_and_month_start():
+    """Sabbaths and months start at sunset too."""
+    after = datetime.datetime(2018, 3, 14, 12)
+    event = events.next_sabbath('Jerusalem', after, weekly_only=True)
+    assert event.start.date() == datetime.date(2018, 3, 16)
+    b_time = _b_time(event.end.date())
+    assert (b_time.year, b_time.month, b_time.day) == event.b_date
+    assert b_time.sabbath.weekly_sabbath is True
+    again = events.next_sabbath('Jerusalem', event.start, weekly_only=True)
+    assert again.start.date() == datetime.date(2018, 3, 23)
+
+    # The 1st day of Unleavened Bread comes before the weekly sabbath.
+    feast = events.next_sabbath('Jerusalem', datetime.datetime(2018, 4, 1))
+    assert feast.b_date == (6018, 1, 15)
+    assert _b_time(feast.end.date()).sabbath.holy_day_of_rest is True
+
+    month = events.next_month_start(after)
+    assert month.b_date == (6018, 1, 1)
+    b_time = _b_time(month.end.date())
+    assert (b_time.year, b_time.month, b_time.day) == month.b_date
+    assert _b_time(month.start.date()).month == 12
+
+
+def test_past_the_end_of_the_data():
+    """Every query returns None past the end of the data."""
+    after = datetime.datetime(2030, 1, 1)
+    assert events.next_sabbath('Jerusalem', after) is None
+    assert events.next_sabbath('Jerusalem', after, weekly_only=True) is None
+    assert events.next_feast(after=after) is None
+    assert events.next_month_start(after) is None
+
+
+def test_one_snapshot_per_query(monkeypatch):
+    """Each query reads the data once, so a refresh in the middle of it
+    can't mix two versions of the data."""
+    snapshot = Aviv.data.MOON_DATA.snapshot
+    calls = []
+
+    def counted():
+        calls.append(True)
+        return snapshot()
+
+    monkeypatch.setattr(Aviv.data.MOON_DATA, 'snapshot', counted)
+    after = datetime.datetime(2018, 4, 1)
+    assert events.next_sabbath('Jerusalem', after) is not None
+    assert len(calls) == 1
+    assert events.next_feast('yom kippur', after) is not None
+    assert len(calls) == 2
+    assert events.next_month_start(after) is not None
+    assert len(calls) == 3
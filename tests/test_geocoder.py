@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Tests for the geocoding in aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tests for the offline geocoder in aviv-calendar.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# -- END OF INTRO -- #
+
+import threading
+import time
+import pytest
+from astral import Astral
+from aviv import Aviv
+from aviv.geocoder import LocationPool, OfflineGeocoder
+
+
+def test_offline_geocoder_agrees_with_astral():
+    """The same cities are found as with the geocoder of astral."""
+    geocoder = OfflineGeocoder()
+    reference = Astral()
+    for name in ('Jerusalem', 'stockholm', 'ABU DHABI', 'new york'):
+        location = geocoder[name]
+        expected = reference[name]
+        assert location.name == expected.name
+        assert location.region == expected.region
+        assert location.latitude == expected.latitude
+        assert location.longitude == expected.longitude
+        assert location.timezone == expected.timezone
+    assert geocoder['Abu Dhabi, United Arab Emirates'].region == (
+        'United Arab Emirates')
+
+
+def test_offline_geocoder_fails_fast():
+    """Unknown cities raise KeyError right away."""
+    geocoder = OfflineGeocoder()
+    start = time.perf_counter()
+    with pytest.raises(KeyError):
+        geocoder['Skepplanda']
+    with pytest.raises(Exception, match='That city is not found'):
+        Aviv.BibLocation('Skepplanda', 'offline')
+    assert time.perf_counter() - start < 1
+
+
+def test_offline_geocoder_prefix_search():
+    """Cities can be found from the beginning of their names."""
+    geocoder = OfflineGeocoder()
+    assert 'stockholm' in geocoder.complete('Stock')
+    assert geocoder.lookup('Jerus', fuzzy=True).name == 'Jerusalem'
+    with pytest.raises(KeyError):
+        geocoder.lookup('Jerus')
+
+
+def test_location_pool_resolves_each_city_once():
+    """Every BibLocation of a city shares the same, once resolved, Location."""
+    first = Aviv.BibLocation('Jerusalem', 'astral', 2018, 1, 1, 12)
+    second = Aviv.BibLocation(' jerusalem ', 'astral', 2018, 1, 2, 12)
+    assert first.location is second.location
+    assert Aviv.resolve_location('JERUSALEM') is first.location
+
+    pool = LocationPool()
+    calls = []
+
+    def find(city_name):
+        calls.append(city_name)
+        return OfflineGeocoder()[city_name]
+
+    threads = [
+        threading.Thread(target=pool.get, args=('Manila', 'astral', find))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ['Manila']
+    assert len(pool) == 1
+
+
+def test_location_pool_only_waits_for_the_same_city():
+    """A slow lookup of one city doesn't hold up the lookup of another."""
+    pool = LocationPool()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_find(city_name):
+        started.set()
+        release.wait(5)
+        return OfflineGeocoder()[city_name]
+
+    thread = threading.Thread(target=pool.get,
+                              args=('Manila', 'astral', slow_find))
+    thread.start()
+    try:
+        assert started.wait(5)
+        location = pool.get('London', 'astral',
+                            lambda name: OfflineGeocoder()[name])
+        assert location.name == 'London'
+        assert not release.is_set()
+    finally:
+        release.set()
+        thread.join()
+    assert len(pool) == 2
+
+
+def test_location_pool_forgets_cities_not_found():
+    """A failed lookup leaves nothing behind in the pool."""
+    pool = LocationPool()
+    for number in range(3):
+        with pytest.raises(KeyError):
+            pool.get('Nowhere {}'.format(number), 'astral',
+                     lambda name: OfflineGeocoder()[name])
+    assert len(pool) == 0
+    assert pool._key_locks == {}
+
+
+def test_bib_location_takes_a_resolved_location():
+    """A Location that has already been looked up is used as it is."""
+    location = Aviv.resolve_location('Manila')
+    b_location = Aviv.BibLocation(location, 'astral', 2018, 1, 1, 12)
+    assert b_location.location is location
+    d = Aviv.BibTime(location, 'astral', 2018, 1, 1, 12)
+    assert d.b_location.location is location
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tests for the instrumentation of aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tests for the instrumentation of aviv-calendar.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# -- END OF INTRO -- #
+
+import datetime
+from aviv import Aviv
+from aviv import astro
+from aviv import instrument
+
+
+def test_stages_are_timed_and_aggregated():
+    """Each conversion reports its stages and cache counts to the hooks."""
+    conversions = []
+    aggregator = instrument.StageAggregator()
+    # The month start is looked up once, before the conversions counted.
+    Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 31, 12)
+    astro.SUN_CACHE.clear()
+    with instrument.recording(conversions.append):
+        with instrument.recording(aggregator):
+            for hour in (12, 20):
+                Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 31, hour)
+    assert instrument.ENABLED is False
+    Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 31, 20)
+
+    assert len(conversions) == 2
+    for conversion in conversions:
+        assert set(conversion.stages) == set(instrument.STAGES)
+        assert conversion.total >= sum(conversion.stages.values())
+    assert conversions[0].caches['sun'] == {'hits': 0, 'misses': 1}
+    assert conversions[1].caches['sun'] == {'hits': 1, 'misses': 0}
+
+    report = aggregator.report()
+    assert report['sun']['count'] == 2
+    assert report['total']['p50'] <= report['total']['p99']
+    assert report['caches']['sun'] == {'hits': 1, 'misses': 1}
+
+
+def test_percentile():
+    """Percentiles are taken by the nearest rank."""
+    values = list(range(1, 101))
+    assert instrument.percentile(values, 0.5) == 50
+    assert instrument.percentile(values, 0.99) == 99
+    assert instrument.percentile([3], 0.99) == 3
+    assert instrument.percentile([], 0.5) is None
+
+
+def test_clear_caches():
+    """clear_caches empties every registered cache, for a cold start."""
+    Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 1, 12)
+    astro.moon_phase(datetime.date(2018, 3, 1))
+    assert len(astro.SUN_CACHE) and len(astro.MOON_PHASE_CACHE)
+    instrument.clear_caches()
+    assert len(astro.SUN_CACHE) == 0
+    assert len(astro.MOON_PHASE_CACHE) == 0
+    assert len(Aviv.YEAR_CALENDARS) == 0
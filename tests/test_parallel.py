@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Tests for parallel conversion in aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tests for parallel conversion in aviv-calendar.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# -- END OF INTRO -- #
+
+import datetime
+from aviv import Aviv
+from aviv import parallel
+
+
+def test_convert_parallel_agrees_with_convert_many():
+    """Each location gets the same columns as from convert_many."""
+    cities = ['Jerusalem', 'London', 'Stockholm']
+    start = datetime.date(2015, 3, 1)
+    dates = [start + datetime.timedelta(days=days) for days in range(90)]
+    results = list(
+        parallel.convert_parallel(cities,
+                                  dates,
+                                  workers=2,
+                                  columns=['year', 'month', 'day',
+                                           'sabbath']))
+    assert [result[0] for result in results] == cities
+    for city, columns in results:
+        expected = Aviv.BibTime.convert_many(dates, city)
+        assert sorted(columns) == ['day', 'month', 'sabbath', 'year']
+        for name in columns:
+            assert columns[name] == expected[name]
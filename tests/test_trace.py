@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Tests for tracing in aviv-calendar."""
+
+# -- BEGINNING OF INTRO: -- #
+
+# A SHORT DESCRIPTION:
+# Tests for tracing in aviv-calendar.
+
+# COPYRIGHT:
+# Copyright (C) 2017 - 2018 Johan Thorén <johan@thoren.xyz>
+
+# LICENSE:
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of version 2 of the GNU General Public License as
+# published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# -- END OF INTRO -- #
+
+from aviv import Aviv
+from aviv import trace
+
+
+def test_traces_only_when_enabled():
+    """Nothing is traced unless tracing has been turned on."""
+    recorder = trace.TraceRecorder()
+    assert trace.ENABLED is False
+    Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 31, 20)
+
+    trace.enable(recorder)
+    try:
+        Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 31, 20)
+    finally:
+        trace.disable()
+    assert 'b_day (day of month) is 14' in recorder.messages()
+    count = len(recorder.records)
+
+    Aviv.BibTime('Jerusalem', 'astral', 2018, 3, 31, 20)
+    assert len(recorder.records) == count